@@ -0,0 +1,1195 @@
+# Humidistat application, imported by main.py (kept as source) so this module can be precompiled or frozen
+#
+# Settings come from boot.py, which runs in the __main__ namespace.
+
+import _thread
+import gc
+import machine
+import utime
+import esp32
+from machine import Pin, TouchPad, I2C, SoftI2C, Timer
+import network
+import ubinascii
+import humidistat
+import anytemp
+import json
+import httpserver
+import batch
+import payload
+import remote
+import history
+import power
+import settings
+import shared
+import wifi
+import timesync
+import random
+import instrument
+import memory
+import watchdog
+import webpage
+import jitter
+import schedules
+from micropython import const
+
+
+from mqtt import MQTTClient
+import __main__
+from __main__ import (dev_name, wifi_ssid, wifi_password, mqtt_server, mqtt_user, mqtt_password, ntp_server,
+                      hour_adjust, remote_sensor, temp_sensor_model, remote_dev)
+# Settings added since, a boot.py from before them keeps working with these defaults (see boot.py.sample)
+dst_rule = getattr(__main__, 'dst_rule', timesync.DST_NONE)
+remote_max_age_seconds = getattr(__main__, 'remote_max_age_seconds', 600)
+remote_aggregate = getattr(__main__, 'remote_aggregate', remote.AGGREGATE_MIN)
+batch_minutes = getattr(__main__, 'batch_minutes', 0)
+metrics_format = getattr(__main__, 'metrics_format', payload.FORMAT_JSON)
+batch_format = getattr(__main__, 'batch_format', payload.FORMAT_JSON)
+power_save = getattr(__main__, 'power_save', False)
+dev_group = getattr(__main__, 'dev_group', '')
+
+# Stage timing and I2C counters (/api/metrics and TOPIC_PERF), False removes the instrumentation at compile time
+INSTRUMENT = const(True)
+
+# Pins and pin configs
+SDA_PIN = 21
+SCL_PIN = 22
+SDA_PIN_SOFT = 18
+SCL_PIN_SOFT = 19
+led = Pin(2,Pin.OUT)  # for onboard LED blink
+DO_DISPLAY = False
+DO_POWER_ON = False
+GPIO_PIN = 13
+TOUCH_PIN = 15
+TOUCH_MAX_VALUE = 250  # 625 when not touching, 120 when touching, check less than this value
+TOUCH_TIMER_ID = 0
+TOUCH_SAMPLE_MS = 100
+TOUCH_DEBOUNCE_SAMPLES = 2  # consecutive touched samples needed to register a touch
+
+# Display timing, each touch extends the time the display is on and shows the next screen
+DISPLAY_ON_MS = 10000
+SCREEN_METRICS = 0
+SCREEN_STATUS = 1
+SCREEN_HISTORY = 2
+SCREEN_COUNT = 3
+
+# Event timing, the evaluation, reporting and reconnect schedule is in schedules.py (also used by tools/fleet_sim.py)
+from schedules import (HUMIDITY_EVALUATION_INTERVAL_SECONDS, MQTT_REPORTING_INTERVAL_SECONDS,
+                       HEALTH_REPORTING_INTERVAL_SECONDS, WIFI_START_SPREAD_MS, NTP_START_SPREAD_MS, WIFI_POLL_MS)
+MQTT_MAX_MESSAGES_PER_CHECK = 10  # per mqtt_check(), which runs every COMMAND_POLL_MS between evaluations
+MEMORY_COLLECT_SECONDS = 60
+
+# Watchdog, each task has to send a heartbeat within its limit or the board is reset (see watchdog.py)
+WATCHDOG_CHECK_MS = 1000
+WATCHDOG_CONTROL_MS = 120000  # evaluation interval plus MQTT socket timeouts
+WATCHDOG_NETWORK_MS = 60000  # WiFi polling, NTP queries and MQTT connects
+WATCHDOG_WEB_MS = 60000  # history streaming and slow clients
+WATCHDOG_DISPLAY_MS = 30000
+WATCHDOG_SLEEP_MS = watchdog.TIMEOUT_MS // 2  # light sleep is split so the watchdog is fed in between
+POWER_SAVE_WAKE_MS = 15000  # power_save wakes this long before an evaluation so WiFi and MQTT can reconnect
+wd = watchdog.Watchdog()
+MQTT_SOCKET_TIMEOUT_SECONDS = 5  # broker connect, reads and writes, so an unreachable broker can't stall a thread
+COMMAND_POLL_MS = 200  # queued web and MQTT commands are applied within this time between evaluations
+
+# MQTT
+CLIENT_ID = ubinascii.hexlify(machine.unique_id())
+# remote_dev can be a device name, a list of device names or "+" to subscribe to all devices
+REMOTE_DEVS = remote_dev if isinstance(remote_dev, list) else [remote_dev]
+TOPICS_SUB = [b'home/%s/metrics' % (d) for d in REMOTE_DEVS]
+TOPIC_PUB = b'home/%s/metrics' % (dev_name)
+# topic -> remote device name, names seen on the "+" subscription are added by remote_device()
+REMOTE_NAMES = {b'home/%s/metrics' % (d): d for d in REMOTE_DEVS if d != '+' and d != dev_name}
+TOPIC_BATCH = b'home/%s/batch' % (dev_name)
+TOPIC_CMD = b'home/%s/set' % (dev_name)
+# commands published to the group topic reconfigure every device with the same dev_group
+TOPIC_GROUP_CMD = b'home/%s/set' % (dev_group) if dev_group else None
+TOPIC_STATE = b'home/%s/state' % (dev_name)
+TOPIC_PERF = b'home/%s/perf' % (dev_name)
+TOPIC_MEMORY = b'home/%s/memory' % (dev_name)
+
+# Wifi object, link reconnects in the background (network_thread) with backoff
+wlan = network.WLAN(network.STA_IF)
+link = wifi.WifiManager(wlan, wifi_ssid, wifi_password, start_delay_ms=jitter.offset(CLIENT_ID, WIFI_START_SPREAD_MS))
+
+# metric variables
+SIGNAL = 0
+TEMPERATURE_STRING = ""
+TEMPERATURE_VAL = 0
+HUMIDITY_VAL = 0
+HUMIDITY_STRING = ""
+# PRESSURE_STRING = ""
+IP = ""
+
+# RTC is kept in UTC and resynced from NTP in network_thread, local time uses hour_adjust and dst_rule
+clock = timesync.TimeService(ntp_server, hour_adjust, dst_rule, start_delay_ms=jitter.offset(CLIENT_ID, NTP_START_SPREAD_MS))
+
+# Humidistat
+hs = humidistat.Humidistat(GPIO_PIN, localtime=clock.localtime)
+HUMIDITY_DESIRED = 40
+HUMIDITY_REMOTE = 0
+remotes = remote.RemoteSensors(remote_max_age_seconds, remote_aggregate)
+PUBLISH_STATE = True  # publish retained settings on TOPIC_STATE when they change
+
+# Broker connection, connected by network_thread and used by the control thread until a publish or check fails
+mqtt_client = None
+mqtt_connections = 0
+mqtt_received = 0  # messages delivered to sub_cb
+mqtt_backoff = schedules.mqtt_backoff(CLIENT_ID)  # failed attempts and dropped connections back off with jitter
+# Only humidistat_thread changes the values above and hs, the web server and display read state.current
+# and queue setting changes with state.queue()
+state = shared.SharedState()
+# Settings and control state saved to flash (writes are coalesced and debounced)
+store = settings.SettingsStore()
+
+# Time (ms since boot) and free heap when each boot phase completed
+boot_timeline = []
+SENSOR_RETRY_MS = 500
+
+# Readings for /api/history (6 hours in RAM, appended to flash every hour)
+HISTORY_DEFAULT_SECONDS = 6 * 3600
+HISTORY_CHUNK_SIZE = 512
+HISTORY_MAX_ROWS = 4000  # per request, use a larger step or a later start for more
+HISTORY_MAX_MS = WATCHDOG_WEB_MS // 2  # a slower client gets a truncated stream instead of stalling the web thread
+# Awake time and estimated current, light sleep between evaluations when power_save is True
+pm = power.PowerMonitor()
+
+readings = history.History(size=HISTORY_DEFAULT_SECONDS // HUMIDITY_EVALUATION_INTERVAL_SECONDS)
+
+# Batch of per-minute samples published every batch_minutes (None when batching is disabled)
+samples = None
+if batch_minutes > 0:
+    samples = batch.SampleBatch(batch_minutes * 60 // HUMIDITY_EVALUATION_INTERVAL_SECONDS)
+
+# Heap telemetry (/api/memory), buffers used on every publish and web request are reserved here at startup
+# before the heap fragments
+mem = memory.MemoryMonitor()
+METRICS_BUF = bytearray(payload.METRICS_SIZE)
+BATCH_BUF = None
+if samples is not None:
+    BATCH_BUF = bytearray(payload.BATCH_HEADER_SIZE + samples.size * payload.BATCH_SAMPLE_SIZE)
+
+# I2C
+# 60 (0x3c) = ssd1306, 118 (0x76) = bme280, 56 (0x38) = aht10
+i2c = I2C(1, scl=Pin(SCL_PIN), sda=Pin(SDA_PIN), freq=400000)
+i2c_s = SoftI2C(sda=Pin(SDA_PIN_SOFT), scl=Pin(SCL_PIN_SOFT))
+if INSTRUMENT:
+    # one bus per driver, so per bus counters are per driver counters
+    i2c = instrument.CountingI2C(i2c, 'display')
+    i2c_s = instrument.CountingI2C(i2c_s, 'sensor')
+# print(i2c.scan())  # to debug I2C
+# print(i2c_s.scan())  # to debug SoftI2C
+
+# Display object is created (and ssd1306 imported) on the first touch, see get_display()
+display = None
+
+# Create AnyTemp object (abstraction for different temp sensors)
+temp_sensor = anytemp.AnyTemp(i2c_s, temp_sensor_model)
+
+def wifi_connected():
+    # called by network_thread each time link (re)connects
+    global IP
+    print("Interface's MAC: ", ubinascii.hexlify(network.WLAN().config('mac'),':').decode()) # print the interface's MAC
+    IP = wlan.ifconfig()
+    print("Interface's IP/netmask/gw/DNS: ", IP,"\n") # print the interface's IP/netmask/gw/DNS addresses
+
+def send_metrics(client):
+    if metrics_format == payload.FORMAT_BIN:
+        msg = payload.encode_metrics(SIGNAL, TEMPERATURE_VAL, HUMIDITY_VAL, hs.state, hs.humidity_desired, METRICS_BUF)
+    else:
+        msg = b'{{"s":"{0}","t":"{1}","h":"{2}","r":"{3}","d":"{4}"}}'.format(SIGNAL, TEMPERATURE_STRING, HUMIDITY_STRING, hs.state, hs.humidity_desired)
+    try:
+        client.publish(TOPIC_PUB, msg)
+    except:
+        print('MQTT: publish failed')
+        return
+    print('MQTT: published metrics')
+
+def send_batch(client):
+    if batch_format == payload.FORMAT_BIN:
+        msg = payload.encode_batch(samples, BATCH_BUF)
+    else:
+        msg = samples.to_msg()
+    try:
+        client.publish(TOPIC_BATCH, msg)
+    except:
+        print('MQTT: batch publish failed')
+        return
+    samples.clear()
+    print('MQTT: published batch')
+
+def send_state(client):
+    global PUBLISH_STATE
+    schedule = ""
+    if hs.schedule:
+        schedule = '{0:02d}:{1:02d}-{2:02d}:{3:02d}'.format(hs.schedule[0] // 60, hs.schedule[0] % 60, hs.schedule[1] // 60, hs.schedule[1] % 60)
+    msg = b'{{"d":{0},"m":"{1}","sched":"{2}","r":{3}}}'.format(hs.humidity_desired, humidistat.MODE_NAMES[hs.mode], schedule, hs.state)
+    client.publish(TOPIC_STATE, msg, retain=True)
+    PUBLISH_STATE = False
+    print('MQTT: published state')
+
+def parse_minute(value):
+    # "HH:MM" to minute of the day
+    hour, minute = value.split(':')
+    hour = int(hour)
+    minute = int(minute)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError('invalid time %s' % value)
+    return hour * 60 + minute
+
+def parse_command(msg):
+    # msg is JSON with any of "d" (desired humidity), "m" (off, on, auto) and "sched" ("HH:MM-HH:MM" or "" to clear)
+    # returns a command for state.queue(), None if msg is invalid
+    command = {}
+    try:
+        cmd = json.loads(msg)
+        if 'd' in cmd:
+            command['d'] = int(cmd['d'])
+            if not 0 <= command['d'] <= 100:
+                raise ValueError('invalid humidity %s' % command['d'])
+        if 'm' in cmd:
+            command['m'] = humidistat.MODE_NAMES.index(cmd['m'])
+        if 'sched' in cmd:
+            if cmd['sched']:
+                start, stop = cmd['sched'].split('-')
+                command['sched'] = (parse_minute(start), parse_minute(stop))
+            else:
+                command['sched'] = None
+    except Exception as e:
+        print('invalid command {0}: {1}'.format(msg, e))
+        return None
+    return command
+
+def apply_commands() -> bool:
+    # humidistat_thread only: applies queued commands in order, returns True if there were any
+    global HUMIDITY_DESIRED, PUBLISH_STATE
+    commands = state.take()
+    if not commands:
+        return False
+    for sequence, command in commands:
+        if 'd' in command:
+            HUMIDITY_DESIRED = command['d']
+            hs.set_humidity_percent(HUMIDITY_DESIRED)
+        if 'm' in command:
+            hs.set_mode(command['m'])
+        if 'sched' in command:
+            if command['sched']:
+                hs.set_schedule(command['sched'][0], command['sched'][1])
+            else:
+                hs.set_schedule()
+    hs.evaluate(current_humidity(), True) # evaluate humidity with overrides
+    PUBLISH_STATE = True
+    publish_snapshot()
+    state.applied = sequence
+    return True
+
+def publish_snapshot():
+    # humidistat_thread only: makes the current values visible to the web server and display
+    if remote_sensor:
+        source = remotes.source
+    else:
+        source = ""
+    state.publish(shared.Snapshot(TEMPERATURE_STRING, HUMIDITY_STRING, HUMIDITY_REMOTE, source, SIGNAL,
+                                  HUMIDITY_DESIRED, hs.mode, hs.state, hs.get_last_activity_msg()))
+
+def current_humidity():
+    if remote_sensor:
+        return HUMIDITY_REMOTE
+    return HUMIDITY_VAL
+
+def remote_device(topic):
+    # returns the device name for home/<device>/metrics topics from remote devices, otherwise None.
+    # Names are decoded once per device and looked up by topic after that, so a reading doesn't allocate here
+    device = REMOTE_NAMES.get(topic)
+    if device is not None or '+' not in REMOTE_DEVS:
+        return device
+    if topic == TOPIC_PUB or not (topic.startswith(b'home/') and topic.endswith(b'/metrics')):
+        return None
+    device = topic[5:-8].decode()
+    if not device or '/' in device:
+        return None
+    REMOTE_NAMES[topic] = device
+    return device
+
+def sub_cb(topic, msg):
+    # called for every message from a topic whose rate we don't control, readings are parsed from msg in place
+    global mqtt_received
+    mqtt_received += 1
+    last_receive = timesync.monotonic()
+    if topic == TOPIC_CMD or topic == TOPIC_GROUP_CMD:
+        print('%s: received command on topic %s: %s' % (last_receive, topic, msg))
+        command = parse_command(msg)
+        if command:
+            state.queue(command)
+        return
+    device = remote_device(topic)
+    if device:
+        if payload.is_binary(msg):
+            # None for a malformed payload, batches (no single reading) are ignored
+            data = payload.decode(msg)
+            humidity = data['h'] if data is not None and 'b' not in data else None
+        else:
+            humidity = payload.parse_field(msg, payload.KEY_HUMIDITY)
+        if humidity is not None:
+            remotes.update(device, round(humidity, 1), last_receive)
+
+def mqtt_connect_and_subscribe(max_retry=5):
+    global CLIENT_ID, mqtt_server, PUBLISH_STATE
+    retry = 0
+    while True:
+        client = None
+        try:
+            client = MQTTClient(CLIENT_ID, mqtt_server, port=1883, user=mqtt_user, password=mqtt_password,
+                                socket_timeout=MQTT_SOCKET_TIMEOUT_SECONDS)
+            client.set_callback(sub_cb)
+            client.connect()
+            client.subscribe(TOPIC_CMD)
+            if TOPIC_GROUP_CMD:
+                client.subscribe(TOPIC_GROUP_CMD)
+            if remote_sensor:
+                for topic in TOPICS_SUB:
+                    client.subscribe(topic)
+                print('Connected to %s MQTT broker, subscribed to %s topics' % (mqtt_server, TOPICS_SUB))
+            else:
+                print('Connected to %s MQTT broker, subscribed to %s topic' % (mqtt_server, TOPIC_CMD))
+            PUBLISH_STATE = True
+            return client
+        except:
+            if client:
+                mqtt_disconnect(client)
+            if retry >= max_retry:
+                print('MQTT retry limited reached')
+                return
+            print('.', end='')
+            utime.sleep(3.0)
+            retry += 1
+            pass
+
+def mqtt_check(client):
+    # humidistat_thread only: handles the messages waiting on the connection (check_msg handles one per call),
+    # at most MQTT_MAX_MESSAGES_PER_CHECK so a flood of remote readings can't hold up control
+    for _ in range(MQTT_MAX_MESSAGES_PER_CHECK):
+        received = mqtt_received
+        client.check_msg()
+        if mqtt_received == received:
+            break
+
+def mqtt_service(client):
+    # humidistat_thread only: reads commands and remote humidity, applies the commands and acknowledges them on
+    # TOPIC_STATE, returns None when the connection failed (network_thread reconnects)
+    try:
+        if INSTRUMENT:
+            start = utime.ticks_us()
+        mqtt_check(client)
+        if INSTRUMENT:
+            instrument.record('mqtt_check', start)
+        apply_commands()
+        if PUBLISH_STATE:
+            send_state(client)
+    except Exception as e:
+        # drop the connection and keep controlling locally, MQTT reconnects once WiFi is back
+        print('err: {0}, MQTT disconnected'.format(e))
+        return mqtt_disconnect(client)
+    return client
+
+def mqtt_disconnect(client):
+    # called by the control thread when the connection fails, network_thread reconnects after a backoff
+    global mqtt_client
+    if client is mqtt_client:
+        mqtt_client = None
+        mqtt_backoff.failed()
+    try:
+        client.sock.close()
+    except Exception:
+        pass
+    return None
+
+def mqtt_poll():
+    # runs on network_thread while WiFi is up, the control thread picks up mqtt_client at its next evaluation
+    global mqtt_client, mqtt_connections
+    if mqtt_client is not None or not mqtt_backoff.due():
+        return
+    client = mqtt_connect_and_subscribe(max_retry=0)
+    if client is None:
+        mqtt_backoff.failed()
+        return
+    mqtt_backoff.succeeded()
+    mqtt_connections += 1
+    mqtt_client = client
+    if mqtt_connections == 1:
+        boot_phase('mqtt connected')
+
+def blink():
+    led.on()
+    utime.sleep_ms(500)
+    led.off()
+    utime.sleep_ms(500)
+
+def draw_display(screen=SCREEN_METRICS):
+    if display.background is None:
+        # static layer drawn once, dynamic text is drawn over a copy of it
+        display.fill(0)  # clear display by filling with black
+        display.rect(0, 0, 128, 64, 1)
+        display.hline(0, 50, 128, 1)
+        display.save_background()
+    display.restore_background()
+
+    display.text(str(IP[0]), 2, 54, 1)
+
+    if screen == SCREEN_STATUS:
+        draw_status()
+    elif screen == SCREEN_HISTORY:
+        draw_history()
+    else:
+        draw_metrics()
+
+    retry = 3
+    while retry > 0:
+        try:
+            if INSTRUMENT:
+                start = utime.ticks_us()
+            display.show()
+            if INSTRUMENT:
+                instrument.record('display', start)
+            break
+        except:
+            print("retry display (usually I2C timeout when waking from capacitive touch")
+            utime.sleep(0.5)
+            retry -= 1
+            continue
+
+def draw_status():
+    snapshot = state.current
+    display.text('relay:' + ('on' if snapshot.relay == 1 else 'off'), 2, 4, 1)
+    display.text('mode:' + humidistat.MODE_NAMES[snapshot.mode], 2, 16, 1)
+    # last activity message split over 2 lines of 15 characters
+    msg = snapshot.msg
+    display.text(msg[:15], 2, 28, 1)
+    display.text(msg[15:30], 2, 38, 1)
+
+def draw_history():
+    # humidity over the last hour scaled to the area above the divider
+    time_current = clock.time()
+    values = [sample[2] for sample in readings.read_ram(time_current - 3600, time_current, -1)]
+    if len(values) < 2:
+        display.text('no history', 2, 20, 1)
+        return
+    low = min(values)
+    high = max(values)
+    display.text('{0:.0f}-{1:.0f}%'.format(low / 10, high / 10), 2, 2, 1)
+    span = max(high - low, 1)
+    step = 124 / (len(values) - 1)
+    for i in range(1, len(values)):
+        y0 = 46 - (values[i - 1] - low) * 32 // span
+        y1 = 46 - (values[i] - low) * 32 // span
+        display.line(2 + int((i - 1) * step), y0, 2 + int(i * step), y1, 1)
+
+def draw_metrics():
+    snapshot = state.current
+    display.text(str(snapshot.signal), 100, 2, 1)
+
+    if snapshot.temperature:
+        temperature_display = snapshot.temperature + ' F'
+        display.text(temperature_display, 2, 4, 1)
+    if snapshot.humidity:
+        humidity_display = snapshot.humidity + '%'
+        display.text(humidity_display, 2, 18, 1)
+    # if PRESSURE_STRING:
+    #     display.text(PRESSURE_STRING, 2, 32, 1)
+    humidity_desired_display = 'desired:' + str(snapshot.desired) + '%'
+    display.text(humidity_desired_display, 2, 32, 1)
+    if snapshot.relay == 1:
+        switch_display = "on"
+    else:
+        switch_display = "off"
+    display.text(switch_display, 100, 32, 1)
+
+def get_metrics_local():
+    # variables used in display (TODO: pass w/ kwargs)
+    global TEMPERATURE_STRING
+    global TEMPERATURE_VAL
+    global HUMIDITY_STRING
+    global HUMIDITY_VAL
+    # global PRESSURE_STRING
+    global SIGNAL
+
+    if INSTRUMENT:
+        start = utime.ticks_us()
+    temp_sensor.read()
+    if INSTRUMENT:
+        instrument.record('sensor', start)
+    TEMPERATURE_VAL = temp_sensor.temperature
+    HUMIDITY_VAL = temp_sensor.humidity
+    # PRESSURE_STRING = temp_sensor.pressure
+
+    TEMPERATURE_STRING = "{:0.1f}".format(round(TEMPERATURE_VAL, 1))
+    HUMIDITY_STRING = "{:0.1f}".format(round(HUMIDITY_VAL, 1))
+
+    print(TEMPERATURE_STRING)
+    print(HUMIDITY_STRING)
+    # print(PRESSURE_STRING)
+
+    if wlan.isconnected():
+        SIGNAL = wlan.status('rssi')
+    print(SIGNAL)
+
+def valid_reading() -> bool:
+    return 0 < HUMIDITY_VAL <= 100
+
+def boot_phase(name):
+    # records the time and free heap so boot layouts (source, .mpy, frozen) can be compared on the device
+    ms = utime.ticks_ms()
+    free = gc.mem_free()
+    boot_timeline.append((name, ms, free))
+    print('boot: %s at %s ms, %s bytes free' % (name, ms, free))
+
+def restore_settings():
+    # restores the setpoint, mode, schedule and last on/off time saved before the last reboot
+    global HUMIDITY_DESIRED
+    saved = store.load()
+    HUMIDITY_DESIRED = saved.get('d', HUMIDITY_DESIRED)
+    hs.set_humidity_percent(HUMIDITY_DESIRED)
+    hs.set_mode(saved.get('m', hs.mode))
+    schedule = saved.get('sched')
+    if schedule:
+        hs.set_schedule(schedule[0], schedule[1])
+    if 'last' in saved:
+        if clock.valid() and saved['last'] <= clock.time():
+            hs.last_activity_time = clock.to_monotonic(saved['last'])
+        else:
+            # RTC not set yet (before NTP), count minimum on/off times from boot instead
+            hs.last_activity_time = timesync.monotonic()
+    print('restored settings: %s' % saved)
+
+# (monotonic, UTC) last on/off time, converted once per change so rounding doesn't cause extra writes
+last_activity_utc = None
+
+def save_settings():
+    # queues the current values, the store only writes when they changed and the debounce time has passed
+    global last_activity_utc
+    schedule = list(hs.schedule) if hs.schedule else None
+    values = {'d': HUMIDITY_DESIRED, 'm': hs.mode, 'sched': schedule}
+    if last_activity_utc is None or last_activity_utc[0] != hs.last_activity_time:
+        utc = clock.to_utc(hs.last_activity_time)
+        if utc is not None:
+            last_activity_utc = (hs.last_activity_time, utc)
+    # last on/off time is saved in UTC, kept as it was until the clock is valid
+    if last_activity_utc is not None:
+        values['last'] = last_activity_utc[1]
+    elif 'last' in store.saved:
+        values['last'] = store.saved['last']
+    store.update(values)
+    store.flush()
+
+# Display state, display_off_ticks is None while the display is off
+display_screen = SCREEN_METRICS
+display_off_ticks = None
+
+def get_display():
+    global display
+    if display is None:
+        import ssd1306
+        display = ssd1306.SSD1306_I2C(128, 64, i2c)
+        display.contrast(50)
+    return display
+
+def display_touched():
+    # first touch turns the display on, touches while on show the next screen and extend the on time
+    global display_screen, display_off_ticks
+    get_display()
+    if display_off_ticks is None:
+        display_screen = SCREEN_METRICS
+        display.poweron()
+    else:
+        display_screen = (display_screen + 1) % SCREEN_COUNT
+    display_off_ticks = utime.ticks_add(utime.ticks_ms(), DISPLAY_ON_MS)
+    draw_display(display_screen)
+
+def display_off():
+    global display_off_ticks
+    display_off_ticks = None
+    display.fill(0)  # clear display by filling with black
+    display.poweroff() # power off the display, pixels persist in memory
+
+def humidistat_thread():
+    # local control starts with the first valid reading, MQTT is connected once WiFi is up (network_thread)
+    global HUMIDITY_REMOTE
+
+    # Setup humidistat
+    restore_settings()
+    hs.enable()
+
+    while True:
+        try:
+            get_metrics_local()
+            if valid_reading():
+                break
+        except Exception as e:
+            print('sensor not ready: {0}'.format(e))
+        wd.beat('control')
+        utime.sleep_ms(SENSOR_RETRY_MS)
+    boot_phase('first reading')
+    publish_snapshot()
+
+    control_started = False
+    sensor_failures = 0  # consecutive failed reads
+
+    # The first periodic report is spread over the reporting interval by device (monotonic seconds)
+    monotonic_current = timesync.monotonic()
+    last_mqtt_time, last_report_time = schedules.first_reports(CLIENT_ID, monotonic_current)
+
+    # The first evaluation runs right away, the ones after it are shifted by a per-device phase so devices
+    # that booted together don't evaluate (and publish) in the same second
+    evaluation_phase_ms = schedules.evaluation_phase_ms(CLIENT_ID)
+
+    while True:
+        wd.beat('control')
+        next_evaluation_ticks = utime.ticks_add(utime.ticks_ms(), HUMIDITY_EVALUATION_INTERVAL_SECONDS * 1000 + evaluation_phase_ms)
+        evaluation_phase_ms = 0
+        try:
+            get_metrics_local()
+            sensor_failures = 0
+        except Exception as e:
+            # ex. an I2C OSError, control continues with the last reading (the watchdog only covers a stalled thread)
+            sensor_failures += 1
+            if INSTRUMENT:
+                instrument.count_error('sensor')
+            print('sensor read failed ({0} in a row), using the last reading: {1}'.format(sensor_failures, e))
+
+        # WiFi and the broker are (re)connected by network_thread, control never waits for them
+        client = mqtt_client
+
+        # check for commands and remote humidity (also done between evaluations, see wait_for_next_evaluation)
+        if client:
+            client = mqtt_service(client)
+
+        if remote_sensor:
+            humidity_eval = remotes.value(HUMIDITY_VAL, timesync.monotonic())
+            HUMIDITY_REMOTE = humidity_eval
+            print('remote humidity {0} from {1}, sources: {2}'.format(humidity_eval, remotes.source, remotes.counters))
+        else:
+            # use local sensor
+            humidity_eval = HUMIDITY_VAL
+
+        send = False
+        send_samples = False
+        time_current = clock.time()
+        monotonic_current = timesync.monotonic()
+
+        apply_commands()
+        if INSTRUMENT:
+            start = utime.ticks_us()
+        if hs.evaluate(humidity_eval):
+            # evaluate returns True if anything changed so send update
+            send = True
+        if INSTRUMENT:
+            instrument.record('evaluate', start)
+        publish_snapshot()
+        if not control_started:
+            control_started = True
+            boot_phase('control started')
+        elif samples is None and monotonic_current - last_mqtt_time >= MQTT_REPORTING_INTERVAL_SECONDS:
+            send = True
+
+        readings.add(time_current, TEMPERATURE_VAL, HUMIDITY_VAL, hs.state)
+
+        if samples is not None:
+            # batch replaces the periodic report, state changes are still sent immediately
+            send_samples = samples.add(time_current, TEMPERATURE_VAL, HUMIDITY_VAL, hs.state)
+
+        save_settings()
+
+        mem.sample()
+        send_report = monotonic_current - last_report_time >= HEALTH_REPORTING_INTERVAL_SECONDS
+
+        if client and (send or send_samples or send_report):
+            try:
+                if send:
+                    if INSTRUMENT:
+                        start = utime.ticks_us()
+                    send_metrics(client)
+                    if INSTRUMENT:
+                        instrument.record('publish', start)
+                    last_mqtt_time = monotonic_current
+                if send_samples:
+                    send_batch(client)
+                if send_report:
+                    mem.sample()
+                    client.publish(TOPIC_MEMORY, mem.to_json())
+                    if INSTRUMENT:
+                        client.publish(TOPIC_PERF, instrument.to_json())
+                    last_report_time = monotonic_current
+            except Exception as e:
+                # drop the connection and keep controlling locally, MQTT reconnects once WiFi is back
+                print('err: {0}, MQTT disconnected'.format(e))
+                client = mqtt_disconnect(client)
+
+        wait_for_next_evaluation(next_evaluation_ticks)
+
+def setup_power_save():
+    # WiFi modem sleep while awake, touch wakes the device from light sleep
+    try:
+        wlan.config(pm=wlan.PM_POWERSAVE)
+    except (AttributeError, ValueError):
+        print('WiFi power save not supported by this firmware')
+    esp32.wake_on_touch(True)
+
+def network_sleep():
+    # the WiFi association doesn't survive light sleep, so MQTT is closed and the access point left cleanly
+    # (suspended, so it isn't recorded as an outage).  network_wake() lets network_thread reassociate and
+    # reconnect MQTT right away (no backoff)
+    global mqtt_client
+    client = mqtt_client
+    mqtt_client = None
+    if client:
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+    mqtt_backoff.retry_now()
+    link.suspend()
+
+def network_wake():
+    link.resume()
+
+def wait_for_next_evaluation(next_ticks):
+    # with power_save the device light sleeps while the display is off, up to POWER_SAVE_WAKE_MS before the
+    # evaluation (WiFi is disconnected, the web server and MQTT are down until it reconnects after the wake).
+    # Otherwise (or while the display is on) this thread sleeps and the other threads keep running
+    network_asleep = False
+    while True:
+        wd.beat('control')
+        client = mqtt_client
+        if client:
+            # commands are applied and acknowledged right away, and remote readings from many devices ("+")
+            # are kept up with
+            mqtt_service(client)
+        apply_commands()
+        save_settings()
+        remaining = utime.ticks_diff(next_ticks, utime.ticks_ms())
+        if power_save and display_off_ticks is None and remaining > POWER_SAVE_WAKE_MS:
+            # other threads are paused too, heartbeats restart when the device wakes
+            if not network_asleep:
+                network_sleep()
+                network_asleep = True
+            wd.suspend()
+            woke = pm.sleep(min(remaining - POWER_SAVE_WAKE_MS, WATCHDOG_SLEEP_MS), light=True)
+            wd.resume()
+            wd.check()
+            if woke and machine.wake_reason() == 5:  # capacitive touch
+                touch_wake()
+            continue
+        if network_asleep:
+            network_wake()
+            network_asleep = False
+        if remaining <= 0:
+            return
+        pm.sleep(min(remaining, COMMAND_POLL_MS))
+
+touch_samples = 0
+
+def touch_wake():
+    # the touch that woke the device is usually still held when the timer samples the pad again, counting it as
+    # already registered keeps the timer from showing the next screen right away
+    global touch_samples
+    touch_samples = TOUCH_DEBOUNCE_SAMPLES
+    if display_off_ticks is None:
+        display_touched()
+
+def touch_timer_cb(timer):
+    # runs every TOUCH_SAMPLE_MS from a timer instead of a polling thread
+    global touch_samples
+    wd.beat('display')
+    try:
+        touched = touch0.read() < TOUCH_MAX_VALUE
+    except ValueError:
+        touched = False
+    if touched:
+        touch_samples += 1
+        if touch_samples == TOUCH_DEBOUNCE_SAMPLES:
+            print("touch activated")
+            display_touched()
+    else:
+        touch_samples = 0
+    if display_off_ticks is not None and utime.ticks_diff(utime.ticks_ms(), display_off_ticks) >= 0:
+        display_off()
+
+def start_touchpad():
+    # Setup touchpad sensor
+    # https://mpython.readthedocs.io/en/master/library/micropython/machine/machine.TouchPad.html
+    global touch0
+    touch0 = TouchPad(Pin(TOUCH_PIN))
+    touch0.config(TOUCH_MAX_VALUE)
+    Timer(TOUCH_TIMER_ID).init(period=TOUCH_SAMPLE_MS, mode=Timer.PERIODIC, callback=touch_timer_cb)
+
+HTTP_HEADER_EVENTS = b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n'
+
+MODE_DISPLAY = ("Off", "On", "Auto")
+
+# Server-Sent Events clients (/events), state is pushed only when it changes
+MAX_EVENT_CLIENTS = 2
+EVENT_CHECK_SECONDS = 1
+event_clients = []
+last_event_version = 0
+
+BOOT_ID = random.getrandbits(24)
+
+# Version of the state snapshot, incremented whenever state_json() changes (used for ETags and event pushes)
+# (snapshot version, state_json) cached for /api/state, /events and ETags
+STATE_JSON = (-1, b'')
+
+# Web server
+WEB_MAX_CLIENTS = 4
+WEB_MAX_REQUEST_SIZE = 2048
+WEB_BUFFERS = [bytearray(WEB_MAX_REQUEST_SIZE) for _ in range(WEB_MAX_CLIENTS)]
+HISTORY_BUF = bytearray(HISTORY_CHUNK_SIZE)
+WEB_READ_TIMEOUT_MS = 5000
+
+def web_page_values(snapshot):
+
+    # if gpioSwitch.value() == 1:
+    if snapshot.relay == 1:
+        gpio_state="ON"
+    else:
+        gpio_state="OFF"
+    print('gpio_state={0}'.format(gpio_state))
+    mode = MODE_DISPLAY[snapshot.mode]
+    if remote_sensor:
+        humidity_curr_string = '{0} ({1} {2})'.format(snapshot.humidity, snapshot.humidity_remote, snapshot.source)
+    else:
+        humidity_curr_string = snapshot.humidity
+
+    return (snapshot.temperature, humidity_curr_string, str(snapshot.desired), mode, gpio_state, snapshot.msg)
+
+def state_json(snapshot):
+    # compact snapshot for /api/state and /events ("hr" and "src" are the remote humidity and its source)
+    global STATE_JSON
+    cached = STATE_JSON
+    if cached[0] != snapshot.version:
+        cached = (snapshot.version, b'{{"t":"{0}","h":"{1}","hr":"{2}","src":"{3}","r":{4},"m":"{5}","d":{6},"msg":"{7}"}}'.format(
+            snapshot.temperature, snapshot.humidity, snapshot.humidity_remote, snapshot.source, snapshot.relay,
+            humidistat.MODE_NAMES[snapshot.mode], snapshot.desired, snapshot.msg))
+        STATE_JSON = cached
+    return cached[1]
+
+def state_etag(snapshot):
+    # BOOT_ID keeps ETags from a previous boot from matching
+    return b'"%d-%d"' % (BOOT_ID, snapshot.version)
+
+def send_event(conn, event):
+    conn.sendall(b'data: ')
+    conn.sendall(event)
+    conn.sendall(b'\n\n')
+
+def add_event_client(conn, request) -> bool:
+    # returns True when the connection is kept open as an event stream
+    if len(event_clients) >= MAX_EVENT_CLIENTS:
+        request.keep_alive = False
+        conn.sendall(httpserver.HTTP_BUSY)
+        return False
+    conn.settimeout(EVENT_CHECK_SECONDS)
+    conn.sendall(HTTP_HEADER_EVENTS)
+    send_event(conn, state_json(state.current))
+    event_clients.append(conn)
+    return True
+
+def push_events():
+    # sends the state to event stream clients if it changed
+    global last_event_version
+    if not event_clients:
+        return
+    snapshot = state.current
+    version = snapshot.version
+    if version == last_event_version:
+        return
+    event = state_json(snapshot)
+    for conn in event_clients[:]:
+        try:
+            send_event(conn, event)
+        except OSError:
+            print('event client disconnected')
+            event_clients.remove(conn)
+            conn.close()
+    last_event_version = version
+
+def send_web_page(conn, request):
+    # stream static chunks and dynamic values straight to the socket without building the page
+    snapshot = state.current
+    etag = state_etag(snapshot)
+    if request.not_modified(etag):
+        httpserver.send_not_modified(conn, request, etag)
+        return
+    values = [value.encode() for value in web_page_values(snapshot)]
+    length = webpage.PAGE_LENGTH + sum([len(value) for value in values])
+    httpserver.send_response(conn, request, b'text/html', length, b'ETag: %s\r\nCache-Control: no-cache\r\n' % etag)
+    webpage.send_page(conn, values)
+
+HTTP_SEE_HOME = b'Location: /\r\n'
+
+def handle_page(conn, request):
+    # changes are queued for humidistat_thread and the browser is redirected to the page right away (the server
+    # thread doesn't wait for them), the page's event stream shows the values once they are applied
+    params = request.params()
+    command = {}
+    gpio_switch = params.get('gpioSwitch')
+    if gpio_switch == 'on':
+        print('GPIO ON')
+        command['m'] = humidistat.MODE_ON
+    if gpio_switch == 'off':
+        print('GPIO OFF')
+        command['m'] = humidistat.MODE_OFF
+    result = params.get('set_humidity', '')
+    if result.isdigit() and int(result) <= 100:
+        print("Setting humidity")
+        print(result)
+        command['d'] = int(result)
+        command['m'] = humidistat.MODE_AUTO
+    if command:
+        if not state.queue(command):
+            request.keep_alive = False
+            conn.sendall(httpserver.HTTP_BUSY)
+            return
+        httpserver.send_response(conn, request, b'text/plain', 0, HTTP_SEE_HOME, status=b'303 See Other')
+        return
+    send_web_page(conn, request)
+
+def handle_state(conn, request):
+    snapshot = state.current
+    etag = state_etag(snapshot)
+    if request.not_modified(etag):
+        httpserver.send_not_modified(conn, request, etag)
+        return
+    msg = state_json(snapshot)
+    httpserver.send_response(conn, request, b'application/json', len(msg), b'ETag: %s\r\nCache-Control: no-cache\r\n' % etag)
+    conn.sendall(msg)
+
+def handle_history(conn, request):
+    # streams readings between start and end (seconds since epoch) with one sample per step seconds
+    # format=csv (default) or bin (history.RECORD_FMT records), at most HISTORY_MAX_ROWS rows
+    params = request.params()
+    try:
+        end = int(params.get('end', clock.time()))
+        start = int(params.get('start', end - HISTORY_DEFAULT_SECONDS))
+        step = max(int(params.get('step', HUMIDITY_EVALUATION_INTERVAL_SECONDS)), 1)
+    except ValueError:
+        request.keep_alive = False
+        conn.sendall(httpserver.HTTP_BAD_REQUEST)
+        return
+    binary = params.get('format') == 'bin'
+    if binary:
+        httpserver.send_response(conn, request, b'application/octet-stream', None)
+    else:
+        httpserver.send_response(conn, request, b'text/csv', None)
+        httpserver.send_chunk(conn, request, history.CSV_HEADER)
+
+    buf = HISTORY_BUF  # only used from web_server_thread
+    n = 0
+    rows = 0
+    started = utime.ticks_ms()
+    for sample in readings.samples(start, end, step):
+        if binary:
+            line = None
+            size = history.RECORD_SIZE
+        else:
+            line = b'%d,%.1f,%.1f,%d\n' % (sample[0], sample[1] / 10, sample[2] / 10, sample[3])
+            size = len(line)
+        if n + size > HISTORY_CHUNK_SIZE:
+            # each chunk can take up to the send timeout, the web heartbeat is sent while the client keeps reading
+            if utime.ticks_diff(utime.ticks_ms(), started) > HISTORY_MAX_MS:
+                print('history stream too slow, closing')
+                request.keep_alive = False
+                return  # without the last chunk, so the client sees an incomplete response
+            httpserver.send_chunk(conn, request, memoryview(buf)[:n])
+            wd.beat('web')
+            n = 0
+        if binary:
+            history.pack_record(buf, n, sample)
+        else:
+            buf[n:n + size] = line
+        n += size
+        rows += 1
+        if rows >= HISTORY_MAX_ROWS:
+            break
+    httpserver.send_chunk(conn, request, memoryview(buf)[:n])
+    httpserver.end_chunks(conn, request)
+
+def send_json(conn, request, msg):
+    # status and telemetry endpoints, generated for each request so they aren't cached
+    httpserver.send_response(conn, request, b'application/json', len(msg), b'Cache-Control: no-cache\r\n')
+    conn.sendall(msg)
+
+def handle_power(conn, request):
+    send_json(conn, request, pm.to_json())
+
+def handle_wifi(conn, request):
+    send_json(conn, request, link.to_json())
+
+def handle_time(conn, request):
+    send_json(conn, request, clock.to_json())
+
+def handle_metrics(conn, request):
+    send_json(conn, request, instrument.to_json())
+
+def handle_memory(conn, request):
+    mem.sample()
+    send_json(conn, request, mem.to_json())
+
+def handle_watchdog(conn, request):
+    send_json(conn, request, wd.to_json())
+
+def handle_boot(conn, request):
+    send_json(conn, request, json.dumps(boot_timeline).encode())
+
+def handle_events(conn, request):
+    # keeps the connection open as an event stream
+    return add_event_client(conn, request)
+
+STYLE_HEADERS = b'ETag: %s\r\nCache-Control: max-age=86400\r\nVary: Accept-Encoding\r\n' % webpage.STYLE_ETAG
+STYLE_GZ_HEADERS = b'ETag: %s\r\nCache-Control: max-age=86400\r\nVary: Accept-Encoding\r\nContent-Encoding: gzip\r\n' % webpage.STYLE_GZ_ETAG
+
+def handle_style(conn, request):
+    # pre-gzipped when build.sh's style.css.gz was uploaded and the client accepts it
+    if webpage.STYLE_GZ is not None and 'gzip' in request.headers.get('accept-encoding', ''):
+        etag, body, headers = webpage.STYLE_GZ_ETAG, webpage.STYLE_GZ, STYLE_GZ_HEADERS
+    else:
+        etag, body, headers = webpage.STYLE_ETAG, webpage.STYLE_CSS, STYLE_HEADERS
+    if request.not_modified(etag):
+        httpserver.send_not_modified(conn, request, etag)
+        return
+    httpserver.send_response(conn, request, b'text/css', len(body), headers)
+    conn.sendall(body)
+
+# (method, path) -> handler(conn, request), returns True when the connection is kept open
+WEB_ROUTES = {
+    ('GET', '/'): handle_page,
+    ('POST', '/'): handle_page,
+    ('GET', '/api/state'): handle_state,
+    ('GET', '/api/history'): handle_history,
+    ('GET', '/api/power'): handle_power,
+    ('GET', '/api/boot'): handle_boot,
+    ('GET', '/api/wifi'): handle_wifi,
+    ('GET', '/api/time'): handle_time,
+    ('GET', '/api/memory'): handle_memory,
+    ('GET', '/api/watchdog'): handle_watchdog,
+    ('GET', '/events'): handle_events,
+    ('GET', '/style.css'): handle_style,
+}
+if INSTRUMENT:
+    WEB_ROUTES[('GET', '/api/metrics')] = handle_metrics
+    for route in WEB_ROUTES:
+        WEB_ROUTES[route] = instrument.timed('http', WEB_ROUTES[route])
+
+def network_services():
+    # started once after the first WiFi connection
+    if power_save:
+        setup_power_save()
+
+    print("starting web_server_thread")
+    wd.register('web', WATCHDOG_WEB_MS)
+    _thread.start_new_thread(web_server_thread, ())
+    boot_phase('web server started')
+
+    print("start webrepl")
+    import webrepl
+    webrepl.start()
+    boot_phase('webrepl started')
+
+def network_thread():
+    # keeps WiFi and the broker connected without holding up local control, brings up the web server and webrepl
+    # once connected and resyncs the clock from NTP periodically
+    print("connect wifi")
+    connections = 0
+    while True:
+        wd.beat('network')
+        if link.poll():
+            if link.connections != connections:
+                connections = link.connections
+                wifi_connected()
+                if connections == 1:
+                    boot_phase('wifi connected')
+                    network_services()
+            mqtt_poll()
+            if clock.poll() and clock.syncs == 1:
+                boot_phase('ntp synced')
+                print('boot timeline (ms): %s' % boot_timeline)
+        utime.sleep_ms(WIFI_POLL_MS)
+
+def web_tick():
+    # called by the server at least every EVENT_CHECK_SECONDS
+    wd.beat('web')
+    push_events()
+
+def web_server_thread():
+    # Setup webserver, idle clients are dropped after WEB_READ_TIMEOUT_MS and clients over WEB_MAX_CLIENTS get a 503
+    server = httpserver.HTTPServer(WEB_ROUTES, port=80, buffers=WEB_BUFFERS,
+                                   read_timeout_ms=WEB_READ_TIMEOUT_MS, tick=web_tick, tick_ms=EVENT_CHECK_SECONDS * 1000)
+    while True:
+        try:
+            server.serve_forever()
+        except OSError as e:
+            print('webserver OS error: %s' % e)
+        except Exception as e:
+            print('webserver unknown error: %s' % e)
+
+
+# check how the ESP32 was started up (mainly by touch sensor, hard power on, soft reboot)
+boot_reason = machine.reset_cause()
+if boot_reason == machine.DEEPSLEEP_RESET:
+    print('woke from a deep sleep')  # constant = 4
+    wake_reason = machine.wake_reason()
+    print("Device running for: " + str(utime.ticks_ms()) + "ms")
+    print("wake_reason: " + str(wake_reason))
+    if wake_reason == machine.PIN_WAKE:
+        print("Woke up by external pin (external interrupt)")
+    elif wake_reason == 4:  # machine.RTC_WAKE, but constant doesn't exist
+        print("Woke up by RTC (timer ran out)")
+    elif wake_reason == 5:  # machine.ULP_WAKE, but constant doesn't match
+        print("Woke up capacitive touch")
+        DO_DISPLAY = True
+elif boot_reason == machine.SOFT_RESET:
+    print('soft reset detected')  # constant = 5
+elif boot_reason == machine.PWRON_RESET:
+    print('power on detected') # constant = 1
+    # This is used for 2 main reasons:
+    # 1. Safety net in case there are issues with deep sleep that makes it difficult to re-upload
+    # 2. Often the sensors need a few seconds to get accurate readings when power is first applied
+    #    except deep sleep should cut power on the regulated 3.3V pin, but not 5Vin
+    # DO_POWER_ON = True
+    # SIGNAL = 'NA'
+    # humidistat_thread waits for a valid reading instead of a fixed delay
+    # DO_DISPLAY = True
+elif boot_reason == machine.WDT_RESET:
+    print('WDT_RESET detected') # constant = 3
+    print('stalled task before reset: %s' % wd.previous)
+    # This also seems to indicate a hard power on
+    # DO_POWER_ON = True
+    # SIGNAL = 'NA'
+    # humidistat_thread waits for a valid reading instead of a fixed delay
+    # DO_DISPLAY = True
+else:
+    print('boot_reason={0}'.format(boot_reason))
+
+boot_phase('app loaded')
+
+# collect early and often once the reserved buffers are allocated
+mem.collect()
+mem.set_threshold()
+
+# WiFi, NTP and the web server are brought up in network_thread while humidistat_thread starts local control
+print("starting humidistat_thread")
+wd.register('control', WATCHDOG_CONTROL_MS)
+_thread.start_new_thread(humidistat_thread, ())
+print("starting network_thread")
+wd.register('network', WATCHDOG_NETWORK_MS)
+_thread.start_new_thread(network_thread, ())
+print("starting touchpad timer")
+wd.register('display', WATCHDOG_DISPLAY_MS)
+start_touchpad()
+
+print("done starting threads")
+wd.start()
+last_collect_ticks = utime.ticks_ms()
+while True:
+    utime.sleep_ms(WATCHDOG_CHECK_MS)
+    wd.check()
+    if utime.ticks_diff(utime.ticks_ms(), last_collect_ticks) >= MEMORY_COLLECT_SECONDS * 1000:
+        last_collect_ticks = utime.ticks_ms()
+        mem.collect()   #Perform garbage collection, timed for /api/memory
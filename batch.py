@@ -0,0 +1,52 @@
+# Collects per-minute samples and formats them as a single MQTT message
+
+from array import array
+
+MAX_DELTA = 0xFFFF  # largest time offset from base_time, seconds
+
+
+class SampleBatch:
+    '''
+    Fixed size batch of samples stored in preallocated arrays.
+    Temperature and humidity are stored as tenths (fixed-point) and time as seconds since base_time.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.base_time = 0
+        self.deltas = array('H', [0] * size)
+        self.temperatures = array('h', [0] * size)
+        self.humidities = array('H', [0] * size)
+        self.states = array('B', [0] * size)
+
+    def add(self, time_stamp, temperature, humidity, state) -> bool:
+        '''Adds a sample and returns True when the batch is full'''
+        if self.count >= self.size:
+            # batch was never published (ex. MQTT down), drop oldest sample window
+            self.clear()
+        elif self.count and not 0 <= time_stamp - self.base_time <= MAX_DELTA:
+            # clock stepped (ex. first NTP sync after power on), deltas would wrap in the 'H' array
+            self.clear()
+        if self.count == 0:
+            self.base_time = time_stamp
+        i = self.count
+        self.deltas[i] = time_stamp - self.base_time
+        self.temperatures[i] = int(round(temperature * 10))
+        self.humidities[i] = int(round(humidity * 10))
+        self.states[i] = state
+        self.count += 1
+        return self.count >= self.size
+
+    def clear(self):
+        self.count = 0
+
+    def to_msg(self) -> bytes:
+        '''Returns JSON message with base time ("b"), time deltas ("dt") and values in tenths ("t", "h") and relay state ("r")'''
+        n = self.count
+        return b'{{"b":{0},"dt":[{1}],"t":[{2}],"h":[{3}],"r":[{4}]}}'.format(
+            self.base_time,
+            ','.join([str(v) for v in self.deltas[:n]]),
+            ','.join([str(v) for v in self.temperatures[:n]]),
+            ','.join([str(v) for v in self.humidities[:n]]),
+            ','.join([str(v) for v in self.states[:n]]))
@@ -0,0 +1,18 @@
+#!/bin/sh
+# Precompiles the modules to .mpy bytecode in build/ so the device doesn't compile them from source at every boot.
+# boot.py and main.py are copied as source (MicroPython only runs them as .py files).
+# mpy-cross has to match the firmware's bytecode version: pip install mpy-cross==<firmware version>
+set -e
+cd "$(dirname "$0")"
+rm -rf build
+mkdir build
+for src in *.py; do
+    case "$src" in
+        boot.py|main.py|webrepl_cfg.py) cp "$src" build/ ;;
+        manifest.py) ;;
+        *) mpy-cross -o "build/${src%.py}.mpy" "$src" ;;
+    esac
+done
+# style sheet compressed on the host, the device sends it as is to clients that accept gzip (see webpage.py)
+python3 -c "import gzip, sys, webpage; sys.stdout.buffer.write(gzip.compress(webpage.STYLE_CSS, 9, mtime=0))" > build/style.css.gz
+echo "upload build/* to the device and remove the .py versions of these modules there (.py is imported first)"
@@ -0,0 +1,127 @@
+# Recent readings kept in RAM and appended to flash, read back lazily for the history endpoint
+
+import _thread
+import os
+from array import array
+
+try:
+    import ustruct as struct
+except:
+    import struct
+
+# time(I) temperature tenths(h) humidity tenths(H) relay state(B)
+RECORD_FMT = '<IhHB'
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+CSV_HEADER = b'time,temperature,humidity,relay\n'
+
+
+def pack_record(buf, offset, sample):
+    struct.pack_into(RECORD_FMT, buf, offset, sample[0], sample[1], sample[2], sample[3])
+
+
+class History:
+    '''
+    Ring buffer of the latest samples in RAM.  Every flush_samples samples the unflushed samples are appended to
+    path on flash.  When the file is larger than max_file_bytes it is renamed to path + '.old' (one generation is kept).
+    '''
+
+    def __init__(self, size=360, path='history.bin', flush_samples=60, max_file_bytes=65536):
+        self.size = size
+        self.path = path
+        self.old_path = path + '.old'
+        self.flush_samples = flush_samples
+        self.max_file_bytes = max_file_bytes
+        self.count = 0  # total samples added since boot
+        self.flushed = 0  # value of count at the last flush
+        self.times = array('I', [0] * size)
+        self.temperatures = array('h', [0] * size)
+        self.humidities = array('H', [0] * size)
+        self.states = array('B', [0] * size)
+        self.file_lock = _thread.allocate_lock()
+        self.record = bytearray(RECORD_SIZE)
+
+    def add(self, time_stamp, temperature, humidity, state):
+        i = self.count % self.size
+        self.times[i] = time_stamp
+        self.temperatures[i] = int(round(temperature * 10))
+        self.humidities[i] = int(round(humidity * 10))
+        self.states[i] = state
+        self.count += 1
+        if self.count - self.flushed >= self.flush_samples:
+            self.flush()
+
+    def flush(self):
+        '''Appends samples that are not on flash yet'''
+        start = max(self.flushed, self.count - self.size)
+        end = self.count
+        with self.file_lock:
+            try:
+                if os.stat(self.path)[6] > self.max_file_bytes:
+                    try:
+                        os.remove(self.old_path)
+                    except OSError:
+                        pass
+                    os.rename(self.path, self.old_path)
+            except OSError:
+                pass
+            try:
+                with open(self.path, 'ab') as f:
+                    for n in range(start, end):
+                        i = n % self.size
+                        struct.pack_into(RECORD_FMT, self.record, 0, self.times[i], self.temperatures[i], self.humidities[i], self.states[i])
+                        f.write(self.record)
+            except OSError as e:
+                print('history flush failed: %s' % e)
+                return
+        self.flushed = end
+
+    def read_flash(self, path, start, end):
+        # yields (time, temperature, humidity, state) from a flash file, reading one record at a time
+        record = bytearray(RECORD_SIZE)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return
+        try:
+            while True:
+                with self.file_lock:
+                    n = f.readinto(record)
+                if n != RECORD_SIZE:
+                    break
+                sample = struct.unpack(RECORD_FMT, record)
+                if sample[0] > end:
+                    break
+                if sample[0] >= start:
+                    yield sample
+        finally:
+            f.close()
+
+    def read_ram(self, start, end, after):
+        # yields samples in RAM newer than after (ex. samples already returned from flash, -1 for all)
+        first = max(0, self.count - self.size)
+        for n in range(first, self.count):
+            i = n % self.size
+            time_stamp = self.times[i]
+            if time_stamp <= after or time_stamp < start:
+                continue
+            if time_stamp > end:
+                break
+            yield (time_stamp, self.temperatures[i], self.humidities[i], self.states[i])
+
+    def samples(self, start, end, step=60):
+        '''
+        Yields (time, temperature tenths, humidity tenths, state) between start and end (inclusive) from flash and then
+        RAM, keeping at most one sample per step seconds.
+        '''
+        last_flash = -1
+        next_time = start
+        for path in (self.old_path, self.path):
+            for sample in self.read_flash(path, start, end):
+                last_flash = sample[0]
+                if sample[0] >= next_time:
+                    next_time = sample[0] + step
+                    yield sample
+        for sample in self.read_ram(start, end, last_flash):
+            if sample[0] >= next_time:
+                next_time = sample[0] + step
+                yield sample
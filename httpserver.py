@@ -0,0 +1,359 @@
+# Poll based HTTP server handling several connections from a single thread
+
+import select
+import utime
+
+try:
+    import usocket as socket
+except:
+    import socket
+
+HTTP_BAD_REQUEST = b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n'
+HTTP_NOT_FOUND = b'HTTP/1.1 404 Not Found\r\nConnection: close\r\n\r\n'
+HTTP_NOT_ALLOWED = b'HTTP/1.1 405 Method Not Allowed\r\nConnection: close\r\n\r\n'
+HTTP_TIMEOUT = b'HTTP/1.1 408 Request Timeout\r\nConnection: close\r\n\r\n'
+HTTP_TOO_LARGE = b'HTTP/1.1 413 Payload Too Large\r\nConnection: close\r\n\r\n'
+HTTP_BUSY = b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 10\r\nConnection: close\r\n\r\n'
+
+# responses are written as headers then body, without TCP_NODELAY the body waits for the client's delayed ACK
+TCP_NODELAY = getattr(socket, 'TCP_NODELAY', None)
+
+DRAIN_READS = 8  # reads of unread request bytes before closing a rejected connection
+DRAIN_SIZE = 512
+
+
+def send_response(conn, request, content_type, length, headers=b'', status=b'200 OK'):
+    '''
+    Sends the status line and headers, length is the number of body bytes that follow.
+    Use length=None to stream the body with send_chunk() and end_chunks() when the length isn't known up front.
+    '''
+    if length is None:
+        if request.version == 'HTTP/1.1':
+            request.chunked = True
+            headers += b'Transfer-Encoding: chunked\r\n'
+        else:
+            # HTTP/1.0 clients read the body until the connection is closed
+            request.keep_alive = False
+    else:
+        headers += b'Content-Length: %d\r\n' % length
+    if request.keep_alive:
+        connection = b'keep-alive'
+    else:
+        connection = b'close'
+    conn.sendall(b'HTTP/1.1 %s\r\nContent-Type: %s\r\n%sConnection: %s\r\n\r\n' % (
+        status, content_type, headers, connection))
+
+
+def send_chunk(conn, request, data):
+    if not data:
+        return
+    if request.chunked:
+        conn.sendall(b'%x\r\n' % len(data))
+        conn.sendall(data)
+        conn.sendall(b'\r\n')
+    else:
+        conn.sendall(data)
+
+
+def end_chunks(conn, request):
+    if request.chunked:
+        conn.sendall(b'0\r\n\r\n')
+
+
+def send_not_modified(conn, request, etag):
+    if request.keep_alive:
+        connection = b'keep-alive'
+    else:
+        connection = b'close'
+    conn.sendall(b'HTTP/1.1 304 Not Modified\r\nETag: %s\r\nConnection: %s\r\n\r\n' % (etag, connection))
+
+
+def unquote(value):
+    # decodes application/x-www-form-urlencoded values
+    value = value.replace('+', ' ')
+    if '%' not in value:
+        return value
+    parts = value.split('%')
+    result = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            result.append(int(part[:2], 16))
+            result.extend(part[2:].encode())
+        except ValueError:
+            result.extend(b'%' + part.encode())
+    try:
+        return result.decode()
+    except UnicodeError:
+        # escapes that aren't UTF-8, keep the value as sent
+        return value
+
+
+def parse_params(value) -> dict:
+    params = {}
+    for pair in value.split('&'):
+        if not pair:
+            continue
+        key, _, val = pair.partition('=')
+        params[unquote(key)] = unquote(val)
+    return params
+
+
+class Request:
+    '''Parsed request line and headers (names in lower case) with the body once it has been read'''
+
+    def __init__(self, method, path, query, version, headers):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+        self.body = b''
+        self.keep_alive = False  # set by the server before calling the handler
+        self.chunked = False  # set by send_response
+
+    def not_modified(self, etag) -> bool:
+        '''True when the client already has etag (bytes including quotes)'''
+        return self.headers.get('if-none-match', '').encode() == etag
+
+    def params(self) -> dict:
+        '''Query string parameters merged with form parameters from the body (ignored if it isn't UTF-8)'''
+        params = parse_params(self.query)
+        if self.body and self.headers.get('content-type', '').startswith('application/x-www-form-urlencoded'):
+            try:
+                params.update(parse_params(self.body.decode()))
+            except UnicodeError:
+                pass
+        return params
+
+
+def parse_head(data) -> Request:
+    '''Parses the request line and headers, raises ValueError if malformed'''
+    lines = data.decode().split('\r\n')
+    method, target, version = lines[0].split(' ')
+    if not version.startswith('HTTP/'):
+        raise ValueError('invalid version')
+    path, _, query = target.partition('?')
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError('invalid header')
+        headers[name.strip().lower()] = value.strip()
+    return Request(method, path, query, version, headers)
+
+
+class _Client:
+    def __init__(self, buf, deadline):
+        self.buf = buf
+        self.deadline = deadline
+        self.requests = 0  # requests served on this connection
+        self.reset(0)
+
+    def reset(self, length):
+        self.length = length  # bytes received into buf
+        self.scanned = 0  # bytes checked for the end of the headers
+        self.body_start = -1
+        self.content_length = 0
+        self.request = None
+
+
+class HTTPServer:
+    '''
+    Accepts connections without blocking and incrementally reads requests from several clients at once.
+    routes maps (method, path) to handler(conn, request), which returns True to keep the connection open
+    (ownership passes to the handler), otherwise the connection is closed.
+    Each client reads into one of max_clients buffers of max_request_size bytes allocated up front
+    (or passed in as buffers, ex. reserved at startup before the heap fragments).
+    HTTP/1.1 connections are kept open for up to keepalive_requests requests and closed after keepalive_timeout_ms idle,
+    handlers must send Content-Length (see send_response) for this to work.
+    tick() is called at least every tick_ms while idle.
+    '''
+
+    def __init__(self, routes, port=80, max_clients=4, read_timeout_ms=5000, send_timeout_seconds=5,
+                 max_request_size=2048, keepalive_timeout_ms=15000, keepalive_requests=20, tick=None, tick_ms=1000,
+                 buffers=None):
+        self.routes = routes
+        self.read_timeout_ms = read_timeout_ms
+        self.send_timeout_seconds = send_timeout_seconds
+        self.keepalive_timeout_ms = keepalive_timeout_ms
+        self.keepalive_requests = keepalive_requests
+        self.tick = tick
+        self.tick_ms = tick_ms
+        if buffers is None:
+            buffers = [bytearray(max_request_size) for _ in range(max_clients)]
+        self.buffers = buffers
+        self.max_clients = len(buffers)
+        self.clients = {}  # socket -> _Client
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', port))
+        self.sock.listen(self.max_clients + 1)
+        self.sock.setblocking(False)
+        self.poll = select.poll()
+        self.poll.register(self.sock, select.POLLIN)
+
+    def serve_forever(self):
+        while True:
+            for sock, event in self.poll.poll(self.tick_ms):
+                if sock is self.sock:
+                    self.accept()
+                else:
+                    self.read(sock, event)
+            self.expire()
+            if self.tick:
+                self.tick()
+
+    def accept(self):
+        try:
+            conn, addr = self.sock.accept()
+        except OSError:
+            return
+        print('Got a connection from %s' % str(addr))
+        if not self.buffers:
+            print('webserver busy, rejecting connection')
+            self.reply_and_close(conn, HTTP_BUSY)
+            return
+        conn.setblocking(False)
+        if TCP_NODELAY is not None:
+            try:
+                conn.setsockopt(socket.IPPROTO_TCP, TCP_NODELAY, 1)
+            except OSError:
+                pass
+        self.clients[conn] = _Client(self.buffers.pop(), utime.ticks_add(utime.ticks_ms(), self.read_timeout_ms))
+        self.poll.register(conn, select.POLLIN)
+
+    def read(self, conn, event):
+        client = self.clients.get(conn)
+        if client is None:
+            return
+        if event & (select.POLLHUP | select.POLLERR):
+            self.close(conn)
+            return
+        buf = client.buf
+        if client.length >= len(buf):
+            self.forget(conn)
+            self.reply_and_close(conn, HTTP_TOO_LARGE)
+            return
+        try:
+            n = conn.readinto(memoryview(buf)[client.length:])
+        except OSError:
+            return
+        if n is None:
+            return
+        if n == 0:
+            self.close(conn)
+            return
+        client.length += n
+        self.parse(conn, client)
+
+    def parse(self, conn, client):
+        buf = client.buf
+        if client.request is None:
+            if not self.find_body_start(client):
+                return
+            try:
+                client.request = parse_head(bytes(buf[:client.body_start - 4]))
+                client.content_length = int(client.request.headers.get('content-length', 0))
+            except (ValueError, UnicodeError):
+                self.forget(conn)
+                self.reply_and_close(conn, HTTP_BAD_REQUEST)
+                return
+            if client.content_length < 0 or client.body_start + client.content_length > len(buf):
+                self.forget(conn)
+                self.reply_and_close(conn, HTTP_TOO_LARGE)
+                return
+
+        body_end = client.body_start + client.content_length
+        if client.length < body_end:
+            return
+        request = client.request
+        request.body = bytes(buf[client.body_start:body_end])
+        client.requests += 1
+        connection = request.headers.get('connection', '').lower()
+        if request.version == 'HTTP/1.1':
+            request.keep_alive = connection != 'close'
+        else:
+            request.keep_alive = connection == 'keep-alive'
+        if client.requests >= self.keepalive_requests:
+            request.keep_alive = False
+
+        if not self.dispatch(conn, request):
+            # connection was closed or handed over to the handler
+            self.forget(conn)
+            return
+
+        # keep-alive: move any pipelined bytes to the start of the buffer and wait for the next request
+        leftover = client.length - body_end
+        buf[:leftover] = buf[body_end:client.length]
+        client.reset(leftover)
+        client.deadline = utime.ticks_add(utime.ticks_ms(), self.keepalive_timeout_ms)
+        conn.setblocking(False)
+        if leftover:
+            self.parse(conn, client)
+
+    def find_body_start(self, client) -> bool:
+        # scans newly received bytes for the blank line ending the headers
+        buf = client.buf
+        for i in range(max(client.scanned, 3), client.length):
+            if buf[i] == 10 and buf[i - 1] == 13 and buf[i - 2] == 10 and buf[i - 3] == 13:
+                client.body_start = i + 1
+                return True
+        client.scanned = client.length
+        return False
+
+    def dispatch(self, conn, request) -> bool:
+        # returns True when the connection stays open for another request
+        handler = self.routes.get((request.method, request.path))
+        conn.settimeout(self.send_timeout_seconds)
+        try:
+            if handler is None:
+                for method, path in self.routes:
+                    if path == request.path:
+                        conn.sendall(HTTP_NOT_ALLOWED)
+                        break
+                else:
+                    conn.sendall(HTTP_NOT_FOUND)
+            elif handler(conn, request):
+                # handler owns the connection now
+                return False
+            elif request.keep_alive:
+                return True
+        except Exception as e:
+            print('webserver handler error: %s' % e)
+        conn.close()
+        return False
+
+    def expire(self):
+        now = utime.ticks_ms()
+        for conn in [c for c, client in self.clients.items() if utime.ticks_diff(client.deadline, now) < 0]:
+            if self.clients[conn].length == 0 and self.clients[conn].requests:
+                # idle keep-alive connection
+                self.close(conn)
+                continue
+            print('webserver read timeout')
+            self.forget(conn)
+            self.reply_and_close(conn, HTTP_TIMEOUT)
+
+    def forget(self, conn):
+        self.poll.unregister(conn)
+        self.buffers.append(self.clients.pop(conn).buf)
+
+    def close(self, conn):
+        self.forget(conn)
+        conn.close()
+
+    def reply_and_close(self, conn, response):
+        try:
+            conn.settimeout(self.send_timeout_seconds)
+            conn.sendall(response)
+            # discard what the client already sent, closing with unread data resets the connection
+            # and the client may never see the response
+            conn.setblocking(False)
+            for _ in range(DRAIN_READS):
+                if not conn.recv(DRAIN_SIZE):
+                    break
+        except OSError:
+            pass
+        conn.close()
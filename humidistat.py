@@ -3,23 +3,32 @@
 import time
 from micropython import const
 from machine import Pin
+from timesync import monotonic
 
 MODE_OFF = const(0)
 MODE_ON = const(1)
 MODE_AUTO = const(2)
+MODE_NAMES = ("off", "on", "auto")
 
 
 class Humidistat():
-    def __init__(self, gpioPin, mode=MODE_OFF, minimum_run_minutes=15, minimum_off_minutes=15, maximum_run_minutes=240):
+    '''
+    Run time limits are measured with the monotonic clock (seconds since boot) so NTP corrections don't affect them,
+    init_time and last_activity_time are monotonic seconds.  localtime returns the local time tuple for the schedule.
+    '''
+    def __init__(self, gpioPin, mode=MODE_OFF, minimum_run_minutes=15, minimum_off_minutes=15, maximum_run_minutes=240,
+                 localtime=time.localtime):
         self.gpio_switch = Pin(gpioPin, Pin.OUT)
         self.mode = mode
         self.humidity_threshold = 1
         self.humidity_desired = -1
         self.enabled = False
+        self.schedule = None  # (start, stop) minute of the day when auto mode can run, None to always run
+        self.localtime = localtime
         self.__set_minimum_run_minutes(minimum_run_minutes)
         self.__set_minimum_off_minutes(minimum_off_minutes)
         self.__set_maximum_run_minutes(maximum_run_minutes)
-        time_current = time.time()
+        time_current = monotonic()
         # don't call set_state here since it updates last_activity_time
         self.state = 0
         self.gpio_switch.value(0)
@@ -33,13 +42,30 @@ class Humidistat():
     def set_mode(self, mode: int):
         self.mode = mode
 
+    def set_schedule(self, start_minute=None, stop_minute=None):
+        if start_minute is None or stop_minute is None:
+            self.schedule = None
+        else:
+            self.schedule = (start_minute, stop_minute)
+
+    def in_schedule(self) -> bool:
+        if self.schedule is None:
+            return True
+        t = self.localtime()
+        minute = t[3] * 60 + t[4]
+        start, stop = self.schedule
+        if start <= stop:
+            return start <= minute < stop
+        # schedule spans midnight
+        return minute >= start or minute < stop
+
     def set_state(self, value: int):
         # update switch state if needed and update last_activity_time
         if self.gpio_switch.value() != value:
             print("set_state: switching from %s to %s" % (self.gpio_switch.value(), value))
             self.gpio_switch.value(value)
             self.state = value
-            time_stamp = time.time()
+            time_stamp = monotonic()
             print('updating on/offtime to %s' % time_stamp)
             self.last_activity_time = time_stamp
 
@@ -63,7 +89,7 @@ class Humidistat():
 
         action = "Stopped"
         units = "seconds"
-        time_current = time.time()
+        time_current = monotonic()
 
         if self.last_activity_time < self.init_time:
             action = "No events for"
@@ -98,8 +124,16 @@ class Humidistat():
                 self.set_state(0)
             return self.state
 
-        time_current = time.time()
+        time_current = monotonic()
         last_activity_seconds = time_current - self.last_activity_time
+
+        if not self.in_schedule():
+            print('outside of schedule {0}: not running at {1}'.format(self.schedule, time_current))
+            if self.state == 1:
+                self.set_state(0)
+                return True
+            return False
+
         if self.mode == MODE_AUTO:
             if self.humidity_desired > humidity_current and (self.humidity_desired - humidity_current >= self.humidity_threshold):
                 print('self.humidity_desired ({0}) > humidity_current ({1})'.format(self.humidity_desired, humidity_current))
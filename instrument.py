@@ -0,0 +1,135 @@
+# Latency histograms for hot path stages and I2C transaction counters
+#
+# Call sites in app.py are wrapped in `if INSTRUMENT:` (a const) so setting it to False removes them at compile time.
+
+import utime
+from array import array
+
+# Upper bounds of the histogram buckets in microseconds, the last bucket counts everything slower
+BUCKET_BOUNDS_US = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+
+class Histogram:
+    '''
+    Fixed bucket latency histogram.  Updates are not locked, a stage timed from two threads at the same time can
+    lose a count which is fine for a summary.
+    '''
+
+    def __init__(self):
+        self.buckets = array('I', [0] * (len(BUCKET_BOUNDS_US) + 1))
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def add(self, us):
+        i = 0
+        for bound in BUCKET_BOUNDS_US:
+            if us <= bound:
+                break
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def to_json(self) -> bytes:
+        avg = self.total_us // self.count if self.count else 0
+        return b'{{"n":{0},"avg":{1},"max":{2},"b":[{3}]}}'.format(
+            self.count, avg, self.max_us, ','.join([str(n) for n in self.buckets]))
+
+
+class I2CCounter:
+    '''Transactions, errors and time spent on the bus for one driver'''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_us = 0
+
+    def to_json(self) -> bytes:
+        return b'{{"n":{0},"err":{1},"us":{2}}}'.format(self.count, self.errors, self.total_us)
+
+
+stages = {}  # stage name -> Histogram
+i2c_counters = {}  # driver name -> I2CCounter
+errors = {}  # name -> number of failures (ex. sensor reads)
+
+
+def record(stage, start_us):
+    '''Adds the time since start_us (from utime.ticks_us()) to the stage histogram'''
+    us = utime.ticks_diff(utime.ticks_us(), start_us)
+    histogram = stages.get(stage)
+    if histogram is None:
+        histogram = stages[stage] = Histogram()
+    histogram.add(us)
+
+
+def count_error(name):
+    errors[name] = errors.get(name, 0) + 1
+
+
+def timed(stage, handler):
+    '''Wraps a web handler(conn, request) to record its time under stage'''
+    def wrapper(conn, request):
+        start = utime.ticks_us()
+        try:
+            return handler(conn, request)
+        finally:
+            record(stage, start)
+    return wrapper
+
+
+class CountingI2C:
+    '''Forwards to an I2C or SoftI2C bus and counts the transactions made by the driver using it'''
+
+    def __init__(self, i2c, name):
+        self.i2c = i2c
+        self.counter = i2c_counters[name] = I2CCounter()
+
+    def call(self, method, *args):
+        counter = self.counter
+        start = utime.ticks_us()
+        try:
+            return method(*args)
+        except OSError:
+            counter.errors += 1
+            raise
+        finally:
+            counter.count += 1
+            counter.total_us += utime.ticks_diff(utime.ticks_us(), start)
+
+    def writeto(self, *args):
+        return self.call(self.i2c.writeto, *args)
+
+    def writevto(self, *args):
+        return self.call(self.i2c.writevto, *args)
+
+    def readfrom(self, *args):
+        return self.call(self.i2c.readfrom, *args)
+
+    def readfrom_into(self, *args):
+        return self.call(self.i2c.readfrom_into, *args)
+
+    def readfrom_mem(self, *args):
+        return self.call(self.i2c.readfrom_mem, *args)
+
+    def readfrom_mem_into(self, *args):
+        return self.call(self.i2c.readfrom_mem_into, *args)
+
+    def writeto_mem(self, *args):
+        return self.call(self.i2c.writeto_mem, *args)
+
+    def __getattr__(self, name):
+        # scan() and other calls are forwarded without counting
+        return getattr(self.i2c, name)
+
+
+def to_json() -> bytes:
+    '''Summary of all stages (times in microseconds, bucket bounds in "bounds"), I2C counters and error counts'''
+    parts = [b'"%s":%s' % (name.encode(), histogram.to_json()) for name, histogram in stages.items()]
+    i2c = [b'"%s":%s' % (name.encode(), counter.to_json()) for name, counter in i2c_counters.items()]
+    failures = [b'"%s":%d' % (name.encode(), count) for name, count in errors.items()]
+    return b'{"bounds":[%s],"stages":{%s},"i2c":{%s},"errors":{%s}}' % (
+        ','.join([str(bound) for bound in BUCKET_BOUNDS_US]).encode(), b','.join(parts), b','.join(i2c),
+        b','.join(failures))
@@ -0,0 +1,29 @@
+# Per-device schedule offsets and random jitter, so devices that boot or lose the broker together
+# don't connect and publish in lock-step
+
+import random
+
+JITTER_BITS = 30
+
+
+def device_hash(device_id) -> int:
+    '''32 bit FNV-1a hash of device_id (bytes), the same on every boot'''
+    h = 0x811c9dc5
+    for b in device_id:
+        h = ((h ^ b) * 0x01000193) & 0xffffffff
+    return h
+
+
+def offset(device_id, period) -> int:
+    '''Stable per-device offset in [0, period)'''
+    if period <= 0:
+        return 0
+    return device_hash(device_id) % period
+
+
+def jittered(value, fraction=0.1) -> int:
+    '''Random value within value +/- fraction * value'''
+    spread = int(value * fraction)
+    if spread <= 0:
+        return value
+    return value - spread + random.getrandbits(JITTER_BITS) % (2 * spread + 1)
@@ -0,0 +1,10 @@
+# Freezes the application into a custom firmware so the bytecode and constants (ex. the web page) run from flash:
+#   make -C ports/esp32 BOARD=ESP32_GENERIC FROZEN_MANIFEST=/path/to/micropython-humidistat/manifest.py
+# boot.py (settings) and main.py stay on the device's file system.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+for name in ("app", "anytemp", "ahtx0", "BME280", "batch", "history", "httpserver", "humidistat", "instrument", "jitter",
+             "memory", "mqtt", "payload", "power", "remote", "schedules", "sensornode", "settings", "shared", "ssd1306",
+             "timesync", "watchdog", "webpage", "wifi"):
+    module(name + ".py")
@@ -0,0 +1,56 @@
+# Heap and garbage collection telemetry with high-water marks
+
+import gc
+import utime
+
+THRESHOLD_DIVISOR = 8  # collect after 1/8 of the heap has been allocated
+
+
+class MemoryMonitor:
+    '''
+    Tracks free and allocated heap and the time spent in collect().
+    The low and high-water marks (min free, max allocated) are kept since boot.
+    Collections started by the allocator (gc.threshold) are not timed, only those from collect().
+    '''
+
+    def __init__(self):
+        self.collections = 0
+        self.pause_last_us = 0
+        self.pause_max_us = 0
+        self.pause_total_us = 0
+        self.free = 0
+        self.alloc = 0
+        self.min_free = None
+        self.max_alloc = 0
+
+    def set_threshold(self, divisor=THRESHOLD_DIVISOR):
+        '''Collects whenever 1/divisor of the heap has been allocated, short frequent collections instead of
+        a long one when the heap runs out'''
+        total = gc.mem_free() + gc.mem_alloc()
+        gc.threshold(total // divisor)
+        print('gc threshold %d of %d bytes' % (total // divisor, total))
+
+    def sample(self):
+        self.free = gc.mem_free()
+        self.alloc = gc.mem_alloc()
+        if self.min_free is None or self.free < self.min_free:
+            self.min_free = self.free
+        if self.alloc > self.max_alloc:
+            self.max_alloc = self.alloc
+
+    def collect(self):
+        start = utime.ticks_us()
+        gc.collect()
+        us = utime.ticks_diff(utime.ticks_us(), start)
+        self.collections += 1
+        self.pause_last_us = us
+        self.pause_total_us += us
+        if us > self.pause_max_us:
+            self.pause_max_us = us
+        self.sample()
+
+    def to_json(self) -> bytes:
+        return (b'{{"free":{0},"alloc":{1},"min_free":{2},"max_alloc":{3},'
+                b'"gc":{4},"gc_last_us":{5},"gc_max_us":{6},"gc_total_us":{7}}}').format(
+            self.free, self.alloc, self.min_free or 0, self.max_alloc,
+            self.collections, self.pause_last_us, self.pause_max_us, self.pause_total_us)
@@ -20,7 +20,7 @@ class MQTTException(Exception):
 class MQTTClient:
 
     def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
-                 ssl=False, ssl_params={}):
+                 ssl=False, ssl_params={}, socket_timeout=None):
         if port == 0:
             port = 8883 if ssl else 1883
         self.client_id = client_id
@@ -37,6 +37,7 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        self.socket_timeout = socket_timeout  # seconds for connect, reads and writes, None blocks
 
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
@@ -65,6 +66,7 @@ class MQTTClient:
 
     def connect(self, clean_session=True):
         self.sock = socket.socket()
+        self.sock.settimeout(self.socket_timeout)
         self.sock.connect(self.addr)
         if self.ssl:
             import ussl
@@ -165,7 +167,7 @@ class MQTTClient:
     # messages processed internally.
     def wait_msg(self):
         res = self.sock.read(1)
-        self.sock.setblocking(True)
+        self.sock.settimeout(self.socket_timeout)
         if res is None:
             return None
         if res == b"":
@@ -0,0 +1,188 @@
+# Binary metric payloads (also usable from CPython to decode messages on the backend)
+#
+# All multi-byte fields are little-endian.  Temperature and humidity are fixed-point tenths.
+#
+# metrics (type 0): version(B) type(B) signal(b) temperature(h) humidity(H) relay(B) desired(B)
+# batch (type 1):   version(B) type(B) base_time(I) count(H), then count * [delta(H) temperature(h) humidity(H) relay(B)]
+#
+# JSON payloads always start with "{" so the first byte (version) distinguishes the formats.
+#
+# Batch base times are in the device's epoch, 2000-01-01 on the ESP32 (1970 on the unix port).
+# On the backend use unix_time(data['b']) to get Unix time.
+
+try:
+    import ustruct as struct
+except:
+    import struct
+
+try:
+    from micropython import const
+except:
+    const = lambda x: x
+
+VERSION = 1
+TYPE_METRICS = 0
+TYPE_BATCH = 1
+
+FORMAT_JSON = "json"
+FORMAT_BIN = "bin"
+
+METRICS_FMT = '<BBbhHBB'
+BATCH_HEADER_FMT = '<BBIH'
+BATCH_SAMPLE_FMT = '<HhHB'
+METRICS_SIZE = struct.calcsize(METRICS_FMT)
+BATCH_HEADER_SIZE = struct.calcsize(BATCH_HEADER_FMT)
+BATCH_SAMPLE_SIZE = struct.calcsize(BATCH_SAMPLE_FMT)
+
+EPOCH_2000 = 946684800  # 2000-01-01 in Unix time
+
+
+def encode_metrics(signal, temperature, humidity, state, desired, buf=None) -> bytes:
+    '''Packs into buf (METRICS_SIZE bytes) when given instead of allocating'''
+    if buf is None:
+        buf = bytearray(METRICS_SIZE)
+    struct.pack_into(METRICS_FMT, buf, 0, VERSION, TYPE_METRICS, signal,
+                     int(round(temperature * 10)), int(round(humidity * 10)), state, desired)
+    return buf
+
+
+def encode_batch(samples, buf=None) -> bytes:
+    '''Encodes a batch.SampleBatch, into buf when given (large enough for samples.size samples)'''
+    n = samples.count
+    size = BATCH_HEADER_SIZE + n * BATCH_SAMPLE_SIZE
+    if buf is None:
+        buf = bytearray(size)
+    else:
+        buf = memoryview(buf)[:size]
+    struct.pack_into(BATCH_HEADER_FMT, buf, 0, VERSION, TYPE_BATCH, samples.base_time, n)
+    offset = BATCH_HEADER_SIZE
+    for i in range(n):
+        struct.pack_into(BATCH_SAMPLE_FMT, buf, offset, samples.deltas[i],
+                         samples.temperatures[i], samples.humidities[i], samples.states[i])
+        offset += BATCH_SAMPLE_SIZE
+    return buf
+
+
+KEY_HUMIDITY = b'"h":'
+_QUOTE = const(0x22)
+_MINUS = const(0x2d)
+_DOT = const(0x2e)
+_ZERO = const(0x30)
+_NINE = const(0x39)
+_COMMA = const(0x2c)
+_BRACE = const(0x7d)
+_SPACE = const(0x20)
+_TAB = const(0x09)
+_CR = const(0x0d)
+_LF = const(0x0a)
+
+
+def parse_field(msg, key):
+    '''
+    Extracts a number from a JSON payload without allocating intermediate strings.
+    key includes the quotes and colon (ex. KEY_HUMIDITY), accepts "h":"41.3", "h":41.3 and "h": 41.3.
+    Returns None if the key is missing or the value is malformed.
+    '''
+    i = msg.find(key)
+    if i < 0:
+        return None
+    i += len(key)
+    n = len(msg)
+    while i < n and msg[i] in (_SPACE, _TAB, _CR, _LF):
+        i += 1
+    quoted = i < n and msg[i] == _QUOTE
+    if quoted:
+        i += 1
+    negative = i < n and msg[i] == _MINUS
+    if negative:
+        i += 1
+    value = 0
+    scale = 1
+    digits = 0
+    fraction = False
+    while i < n:
+        c = msg[i]
+        if _ZERO <= c <= _NINE:
+            value = value * 10 + c - _ZERO
+            digits += 1
+            if fraction:
+                scale *= 10
+        elif c == _DOT and not fraction:
+            fraction = True
+        else:
+            break
+        i += 1
+    if digits == 0 or (fraction and scale == 1):
+        return None
+    if quoted:
+        if i >= n or msg[i] != _QUOTE:
+            return None
+        i += 1
+    # value must be followed by the end of the field
+    # (compared as ints, MicroPython's bytes only accept bytes operands for 'in')
+    if i >= n or msg[i] not in (_COMMA, _BRACE, _SPACE, _TAB, _CR, _LF):
+        return None
+    if negative:
+        value = -value
+    return value / scale
+
+
+def is_binary(msg) -> bool:
+    return len(msg) > 1 and msg[0] == VERSION
+
+
+def unix_time(device_time, device_epoch=EPOCH_2000) -> int:
+    '''Converts a batch base time from the device epoch (2000 on the ESP32, pass 0 for the unix port) to Unix time'''
+    return device_time + device_epoch
+
+
+def decode(msg):
+    '''
+    Decodes a binary or JSON payload into a dict using the same keys as the JSON format.
+    Metrics values are returned as numbers, batch temperature and humidity lists remain in tenths.
+    Returns None for a truncated or otherwise malformed payload.
+    '''
+    if not is_binary(msg):
+        import json
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        if 'b' not in data:
+            try:
+                for key in ('t', 'h'):
+                    if key in data:
+                        data[key] = float(data[key])
+                for key in ('s', 'r', 'd'):
+                    if key in data:
+                        data[key] = int(data[key])
+            except (ValueError, TypeError):
+                return None  # ex. "h":"x" or "h":null
+        return data
+
+    if msg[1] == TYPE_METRICS:
+        if len(msg) < METRICS_SIZE:
+            return None
+        _, _, signal, temperature, humidity, state, desired = struct.unpack_from(METRICS_FMT, msg, 0)
+        return {'s': signal, 't': temperature / 10, 'h': humidity / 10, 'r': state, 'd': desired}
+
+    if msg[1] == TYPE_BATCH:
+        if len(msg) < BATCH_HEADER_SIZE:
+            return None
+        _, _, base_time, n = struct.unpack_from(BATCH_HEADER_FMT, msg, 0)
+        if len(msg) < BATCH_HEADER_SIZE + n * BATCH_SAMPLE_SIZE:
+            return None
+        data = {'b': base_time, 'dt': [], 't': [], 'h': [], 'r': []}
+        offset = BATCH_HEADER_SIZE
+        for _ in range(n):
+            delta, temperature, humidity, state = struct.unpack_from(BATCH_SAMPLE_FMT, msg, offset)
+            data['dt'].append(delta)
+            data['t'].append(temperature)
+            data['h'].append(humidity)
+            data['r'].append(state)
+            offset += BATCH_SAMPLE_SIZE
+        return data
+
+    return None  # unknown payload type
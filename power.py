@@ -0,0 +1,48 @@
+# Sleep between evaluations and estimate the average current from the time spent awake
+
+import machine
+import utime
+
+# Rough ESP32 devkit figures, awake with WiFi in modem sleep and in light sleep with WiFi disconnected,
+# adjust for the board
+ACTIVE_MA = 45
+LIGHT_SLEEP_MA = 3
+
+
+class PowerMonitor:
+
+    def __init__(self, active_ma=ACTIVE_MA, sleep_ma=LIGHT_SLEEP_MA):
+        self.active_ma = active_ma
+        self.sleep_ma = sleep_ma
+        self.start_ticks = utime.ticks_ms()
+        self.sleep_ms = 0  # total time in light sleep
+        self.sleeps = 0
+
+    def sleep(self, ms, light=False) -> bool:
+        '''Sleeps for up to ms, returns True if a light sleep was ended early by a wake source other than the timer'''
+        if ms <= 0:
+            return False
+        if not light:
+            utime.sleep_ms(ms)
+            return False
+        before = utime.ticks_ms()
+        machine.lightsleep(ms)
+        slept = utime.ticks_diff(utime.ticks_ms(), before)
+        self.sleep_ms += slept
+        self.sleeps += 1
+        return slept < ms - 10
+
+    def uptime_ms(self) -> int:
+        return utime.ticks_diff(utime.ticks_ms(), self.start_ticks)
+
+    def awake_ms(self) -> int:
+        return self.uptime_ms() - self.sleep_ms
+
+    def estimated_ma(self) -> float:
+        '''Average current since boot weighted by the time awake and in light sleep'''
+        uptime = max(self.uptime_ms(), 1)
+        return (self.awake_ms() * self.active_ma + self.sleep_ms * self.sleep_ma) / uptime
+
+    def to_json(self) -> bytes:
+        return b'{{"uptime_ms":{0},"awake_ms":{1},"sleeps":{2},"ma":{3:.1f}}}'.format(
+            self.uptime_ms(), self.awake_ms(), self.sleeps, self.estimated_ma())
@@ -0,0 +1,53 @@
+# Latest humidity readings from remote sensors with staleness tracking
+
+AGGREGATE_MIN = "min"
+AGGREGATE_MEAN = "mean"
+AGGREGATE_MEDIAN = "median"
+
+SOURCE_LOCAL = "local"
+SOURCE_MEAN = "mean"
+SOURCE_MEDIAN = "median"  # median of an even number of readings, between two devices
+
+
+class RemoteSensors:
+    '''
+    Keeps the latest reading per remote device and aggregates readings that are not older than max_age_seconds.
+    Falls back to the local reading when all remote readings are stale.
+    '''
+
+    def __init__(self, max_age_seconds=600, aggregate=AGGREGATE_MIN):
+        self.max_age_seconds = max_age_seconds
+        self.aggregate = aggregate
+        self.readings = {}  # device name -> (humidity, time received)
+        self.counters = {}  # source -> number of evaluations driven by source
+        self.source = SOURCE_LOCAL
+
+    def update(self, device, humidity, time_stamp):
+        self.readings[device] = (humidity, time_stamp)
+
+    def fresh(self, time_current) -> list:
+        '''Returns list of (humidity, device) for readings that are not stale'''
+        return [(humidity, device) for device, (humidity, time_stamp) in self.readings.items()
+                if time_current - time_stamp <= self.max_age_seconds]
+
+    def value(self, humidity_local, time_current):
+        '''Returns the aggregated humidity and records which source drove the decision'''
+        readings = self.fresh(time_current)
+        if not readings:
+            humidity, source = humidity_local, SOURCE_LOCAL
+        elif self.aggregate == AGGREGATE_MEAN:
+            humidity = sum([r[0] for r in readings]) / len(readings)
+            source = SOURCE_MEAN if len(readings) > 1 else readings[0][1]
+        elif self.aggregate == AGGREGATE_MEDIAN:
+            readings.sort()
+            mid = len(readings) // 2
+            if len(readings) % 2:
+                humidity, source = readings[mid]
+            else:
+                humidity = (readings[mid - 1][0] + readings[mid][0]) / 2
+                source = SOURCE_MEDIAN
+        else:
+            humidity, source = min(readings)
+        self.source = source
+        self.counters[source] = self.counters.get(source, 0) + 1
+        return round(humidity, 1)
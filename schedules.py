@@ -0,0 +1,69 @@
+# Evaluation, reporting and reconnect schedule of the humidistat, shared by app.py and tools/fleet_sim.py so the
+# simulation runs the device's own timing.  Schedules are spread by a hash of the device id and random jitter so a
+# fleet that reboots or loses the broker together doesn't reconnect and publish in lock-step (see jitter.py).
+
+import utime
+import jitter
+
+HUMIDITY_EVALUATION_INTERVAL_SECONDS = 60
+MQTT_REPORTING_INTERVAL_SECONDS = 300
+HEALTH_REPORTING_INTERVAL_SECONDS = 900  # TOPIC_MEMORY and TOPIC_PERF
+MQTT_RETRY_SECONDS = 30  # time between MQTT connection attempts while WiFi is up, doubles up to MQTT_MAX_RETRY_SECONDS
+MQTT_MAX_RETRY_SECONDS = 300
+MQTT_RETRY_JITTER = 0.5
+WIFI_START_SPREAD_MS = 3000
+MQTT_START_SPREAD_MS = 20000  # first broker connect after boot
+NTP_START_SPREAD_MS = 30000
+WIFI_POLL_MS = 500
+
+
+def evaluation_phase_ms(device_id) -> int:
+    '''Added once to the interval after the first evaluation, so devices that booted together evaluate apart'''
+    return jitter.offset(device_id, HUMIDITY_EVALUATION_INTERVAL_SECONDS * 1000)
+
+
+def first_reports(device_id, monotonic_current):
+    '''
+    (last metrics report, last health report) times to start from, in monotonic seconds, so the first periodic
+    reports are spread over their intervals by device
+    '''
+    return (monotonic_current - MQTT_REPORTING_INTERVAL_SECONDS + jitter.offset(device_id, MQTT_REPORTING_INTERVAL_SECONDS),
+            monotonic_current - jitter.offset(device_id, HEALTH_REPORTING_INTERVAL_SECONDS))
+
+
+class Backoff:
+    '''
+    Connection attempt schedule: the first attempt is due first_delay_ms after creation, each failure (or dropped
+    connection) makes the next one due after the delay +/- fraction at random and doubles the delay up to max_ms.
+    '''
+
+    def __init__(self, delay_ms, max_ms, fraction, first_delay_ms=0):
+        self.min_delay_ms = delay_ms
+        self.max_ms = max_ms
+        self.fraction = fraction
+        self.delay_ms = delay_ms
+        self.due_ticks = utime.ticks_add(utime.ticks_ms(), first_delay_ms)
+
+    def due(self) -> bool:
+        return utime.ticks_diff(utime.ticks_ms(), self.due_ticks) >= 0
+
+    def remaining_ms(self) -> int:
+        '''Time until the next attempt is due, 0 if it already is'''
+        return max(utime.ticks_diff(self.due_ticks, utime.ticks_ms()), 0)
+
+    def failed(self):
+        self.due_ticks = utime.ticks_add(utime.ticks_ms(), jitter.jittered(self.delay_ms, self.fraction))
+        self.delay_ms = min(self.delay_ms * 2, self.max_ms)
+
+    def succeeded(self):
+        self.delay_ms = self.min_delay_ms
+
+    def retry_now(self):
+        '''Next attempt due right away without a backoff (ex. after a planned disconnect)'''
+        self.delay_ms = self.min_delay_ms
+        self.due_ticks = utime.ticks_ms()
+
+
+def mqtt_backoff(device_id) -> Backoff:
+    return Backoff(MQTT_RETRY_SECONDS * 1000, MQTT_MAX_RETRY_SECONDS * 1000, MQTT_RETRY_JITTER,
+                   first_delay_ms=jitter.offset(device_id, MQTT_START_SPREAD_MS))
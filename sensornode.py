@@ -0,0 +1,148 @@
+# Deep sleep sensor node: wake, read the sensor, publish to MQTT and go back to deep sleep
+#
+# State that survives deep sleep is kept in RTC memory so a cycle can skip unchanged readings, and connect to the
+# access point found by a scan in an earlier cycle (by BSSID, on its channel where the firmware accepts that).
+# main.py calls main() before app.py is imported, so a wake cycle only loads the modules it needs.
+
+import machine
+import network
+import utime
+import ubinascii
+import payload
+import jitter
+import wifi
+
+try:
+    import ustruct as struct
+except:
+    import struct
+
+from mqtt import MQTTClient
+
+# magic, sequence, temperature tenths, humidity tenths, bssid, channel, awake ms of the previous cycle
+RTC_MAGIC = 0x4853
+RTC_FMT = '<HIhH6sBI'
+RTC_SIZE = struct.calcsize(RTC_FMT)
+
+SDA_PIN_SOFT = 18  # sensor SoftI2C pins, same as app.py
+SCL_PIN_SOFT = 19
+SLEEP_SECONDS = 300
+WIFI_TIMEOUT_MS = 10000
+MQTT_SOCKET_TIMEOUT_SECONDS = 5  # a broker that accepts the connection but doesn't answer can't keep the node awake
+PUBLISH_DELTA = 5  # tenths, smaller changes in temperature and humidity are not published
+FORCE_PUBLISH_CYCLES = 12  # publish at least every N cycles even if readings are unchanged
+SLEEP_JITTER = 0.05  # sleep time varies by +/- 5% so nodes that woke together drift apart
+
+
+class NodeState:
+    def __init__(self):
+        self.sequence = 0
+        self.temperature = -32768
+        self.humidity = 0
+        self.bssid = b'\0' * 6
+        self.channel = 0
+        self.awake_ms = 0
+
+    def load(self):
+        mem = machine.RTC().memory()
+        if len(mem) != RTC_SIZE:
+            return
+        values = struct.unpack(RTC_FMT, mem)
+        if values[0] != RTC_MAGIC:
+            return
+        _, self.sequence, self.temperature, self.humidity, self.bssid, self.channel, self.awake_ms = values
+
+    def save(self):
+        machine.RTC().memory(struct.pack(RTC_FMT, RTC_MAGIC, self.sequence, self.temperature, self.humidity,
+                                         self.bssid, self.channel, self.awake_ms))
+
+
+def wifi_connect(wlan, ssid, password, state) -> bool:
+    # the ESP32 port can't report the BSSID of the current connection, so it comes from a scan when nothing is cached
+    wlan.active(True)
+    if not state.channel:
+        access_point = wifi.find_access_point(wlan, ssid)
+        if access_point:
+            state.bssid, state.channel = access_point
+    wifi.connect(wlan, ssid, password, state.bssid if state.channel else None, state.channel)
+    start = utime.ticks_ms()
+    while not wlan.isconnected():
+        if utime.ticks_diff(utime.ticks_ms(), start) > WIFI_TIMEOUT_MS:
+            # forget cached access point in case it changed, the next cycle scans again
+            state.channel = 0
+            return False
+        utime.sleep_ms(20)
+    return True
+
+
+def publish(make_sensor, ssid, password, mqtt_server, mqtt_user, mqtt_password, topic, metrics_format, state):
+    '''Reads the sensor and publishes when the readings changed (or every FORCE_PUBLISH_CYCLES cycles)'''
+    temp_sensor = make_sensor()
+    temp_sensor.read()
+    temperature = int(round(temp_sensor.temperature * 10))
+    humidity = int(round(temp_sensor.humidity * 10))
+    changed = abs(temperature - state.temperature) >= PUBLISH_DELTA or abs(humidity - state.humidity) >= PUBLISH_DELTA
+    if not changed and state.sequence % FORCE_PUBLISH_CYCLES:
+        print('readings unchanged, skipping publish (cycle %s)' % state.sequence)
+        return
+
+    wlan = network.WLAN(network.STA_IF)
+    try:
+        if not wifi_connect(wlan, ssid, password, state):
+            print('WiFi connect timed out (cycle %s)' % state.sequence)
+            return
+        signal = wlan.status('rssi')
+        if metrics_format == payload.FORMAT_BIN:
+            msg = payload.encode_metrics(signal, temperature / 10, humidity / 10, 0, 0)
+        else:
+            msg = b'{{"s":"{0}","t":"{1:.1f}","h":"{2:.1f}","r":"0","d":"0","n":"{3}","a":"{4}"}}'.format(
+                signal, temperature / 10, humidity / 10, state.sequence, state.awake_ms)
+        client = MQTTClient(ubinascii.hexlify(machine.unique_id()), mqtt_server, port=1883, user=mqtt_user,
+                            password=mqtt_password, socket_timeout=MQTT_SOCKET_TIMEOUT_SECONDS)
+        try:
+            client.connect()
+            client.publish(topic, msg)
+            client.disconnect()
+        finally:
+            if client.sock:
+                client.sock.close()
+        state.temperature = temperature
+        state.humidity = humidity
+        print('MQTT: published metrics (cycle %s)' % state.sequence)
+    finally:
+        wlan.active(False)
+
+
+def run(make_sensor, ssid, password, mqtt_server, mqtt_user, mqtt_password, topic, sleep_seconds, metrics_format):
+    '''
+    Runs one wake cycle and deep sleeps for sleep_seconds, does not return.
+    make_sensor() returns the AnyTemp sensor, it is created in the cycle so a missing sensor is handled like a failed read.
+    '''
+    state = NodeState()
+    state.load()
+    state.sequence += 1
+    try:
+        publish(make_sensor, ssid, password, mqtt_server, mqtt_user, mqtt_password, topic, metrics_format, state)
+    except Exception as e:
+        # ex. an I2C OSError or a broker that doesn't answer, the node must still go back to sleep or it stays
+        # awake until the battery is empty (Ctrl-C at the REPL isn't caught, so the node can still be stopped)
+        print('cycle %s failed: %s' % (state.sequence, e))
+
+    state.awake_ms = utime.ticks_ms()  # ticks restart on every wake
+    state.save()
+    sleep_ms = jitter.jittered(sleep_seconds * 1000, SLEEP_JITTER)
+    print('awake for %s ms, deep sleep for %s ms' % (state.awake_ms, sleep_ms))
+    machine.deepsleep(sleep_ms)
+
+
+def main():
+    '''Runs one wake cycle with the settings from boot.py, does not return'''
+    import __main__
+    from __main__ import (dev_name, wifi_ssid, wifi_password, mqtt_server, mqtt_user, mqtt_password,
+                          temp_sensor_model)
+    metrics_format = getattr(__main__, 'metrics_format', payload.FORMAT_JSON)
+    from machine import Pin, SoftI2C
+    import anytemp
+    make_sensor = lambda: anytemp.AnyTemp(SoftI2C(sda=Pin(SDA_PIN_SOFT), scl=Pin(SCL_PIN_SOFT)), temp_sensor_model)
+    run(make_sensor, wifi_ssid, wifi_password, mqtt_server, mqtt_user, mqtt_password, b'home/%s/metrics' % (dev_name),
+        SLEEP_SECONDS, metrics_format)
@@ -0,0 +1,86 @@
+# Settings and control state persisted on flash so they survive a reboot
+
+import json
+import os
+import utime
+
+PATH = 'settings.json'
+DEBOUNCE_MS = 5000
+
+
+def valid_schedule(value) -> bool:
+    return (isinstance(value, list) and len(value) == 2
+            and all([isinstance(v, int) and 0 <= v < 1440 for v in value]))
+
+
+# key -> validation for loaded values, invalid values are dropped
+VALIDATORS = {
+    'd': lambda v: isinstance(v, int) and 0 <= v <= 100,
+    'm': lambda v: v in (0, 1, 2),
+    'sched': lambda v: v is None or valid_schedule(v),
+    'last': lambda v: isinstance(v, int),
+}
+
+
+class SettingsStore:
+    '''
+    Coalesces updates and writes them at most once per debounce_ms so a burst of changes is a single flash write.
+    Files are written to a temporary file and renamed over the old one so a reset during a write keeps the old values.
+    '''
+
+    def __init__(self, path=PATH, debounce_ms=DEBOUNCE_MS):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.debounce_ms = debounce_ms
+        self.saved = {}
+        self.pending = None
+        self.due_ticks = 0
+
+    def load(self) -> dict:
+        '''Returns validated saved settings, falls back to the temporary file if the rename didn't complete'''
+        for path in (self.path, self.tmp_path):
+            try:
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(values, dict):
+                continue
+            self.saved = {}
+            for key, validator in VALIDATORS.items():
+                if key in values and validator(values[key]):
+                    self.saved[key] = values[key]
+            return dict(self.saved)
+        return {}
+
+    def update(self, values):
+        '''Queues values to be written once the debounce time has passed'''
+        if values == self.saved:
+            self.pending = None
+            return
+        if self.pending is None:
+            self.due_ticks = utime.ticks_add(utime.ticks_ms(), self.debounce_ms)
+        self.pending = values
+
+    def flush(self, force=False):
+        '''Writes pending values if they are due (or force is True)'''
+        if self.pending is None:
+            return
+        if not force and utime.ticks_diff(utime.ticks_ms(), self.due_ticks) < 0:
+            return
+        values = self.pending
+        try:
+            with open(self.tmp_path, 'w') as f:
+                json.dump(values, f)
+            try:
+                os.rename(self.tmp_path, self.path)
+            except OSError:
+                # file systems that can't rename over an existing file
+                os.remove(self.path)
+                os.rename(self.tmp_path, self.path)
+        except OSError as e:
+            print('settings save failed: %s' % e)
+            return
+        self.saved = values
+        self.pending = None
+        print('settings saved')
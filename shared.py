@@ -0,0 +1,75 @@
+# State shared between the control thread and the web server and display.  The control thread is the only
+# writer: it publishes snapshots that readers use without locking, and applies commands other threads queue.
+
+import _thread
+
+
+class Snapshot:
+    '''
+    Values at one point in time.  Not modified once published, readers take shared.current once and read
+    every value from it so they all belong together.  (MicroPython doesn't enforce __slots__, it documents
+    the fields and keeps CPython tools from adding any.)
+    '''
+    __slots__ = ('version', 'temperature', 'humidity', 'humidity_remote', 'source', 'signal', 'desired', 'mode',
+                 'relay', 'msg')
+
+    def __init__(self, temperature='', humidity='', humidity_remote=0, source='', signal=0, desired=0, mode=0,
+                 relay=0, msg=''):
+        self.version = 0
+        self.temperature = temperature  # formatted like "21.5"
+        self.humidity = humidity
+        self.humidity_remote = humidity_remote
+        self.source = source
+        self.signal = signal
+        self.desired = desired
+        self.mode = mode
+        self.relay = relay
+        self.msg = msg  # last activity message
+
+    def same(self, other) -> bool:
+        return (self.temperature == other.temperature and self.humidity == other.humidity
+                and self.humidity_remote == other.humidity_remote and self.source == other.source
+                and self.signal == other.signal and self.desired == other.desired and self.mode == other.mode
+                and self.relay == other.relay and self.msg == other.msg)
+
+
+class SharedState:
+    '''
+    current is replaced by publish() with a single reference assignment, so a reader sees either the old or the
+    new snapshot.  Commands are dicts queued by any thread and applied in order by the control thread (take()),
+    at most max_commands are kept waiting.
+    '''
+
+    def __init__(self, max_commands=8):
+        self.current = Snapshot()
+        self.max_commands = max_commands
+        self.commands = []  # (sequence, command)
+        self.lock = _thread.allocate_lock()  # only guards the command queue
+        self.queued = 0  # sequence of the last queued command
+        self.applied = 0  # sequence of the last applied command
+
+    def publish(self, snapshot) -> Snapshot:
+        '''Control thread only, the version only changes when a value changed'''
+        current = self.current
+        if snapshot.same(current):
+            return current
+        snapshot.version = current.version + 1
+        self.current = snapshot
+        return snapshot
+
+    def queue(self, command) -> int:
+        '''Returns the command's sequence number, 0 if the queue is full'''
+        with self.lock:
+            if len(self.commands) >= self.max_commands:
+                print('command queue full, dropping %s' % command)
+                return 0
+            self.queued += 1
+            self.commands.append((self.queued, command))
+            return self.queued
+
+    def take(self) -> list:
+        '''Control thread only, returns and removes the queued commands'''
+        with self.lock:
+            commands = self.commands
+            self.commands = []
+        return commands
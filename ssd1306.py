@@ -35,6 +35,10 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        # copy of what the display RAM holds, show() only sends pages that differ from it
+        self.shadow = bytearray(self.pages * self.width)
+        self.shadow_valid = False
+        self.background = None
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
 
@@ -94,7 +98,41 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(SET_COM_OUT_DIR | ((rotate & 1) << 3))
         self.write_cmd(SET_SEG_REMAP | (rotate & 1))
 
+    def invalidate(self):
+        # next show() sends the whole buffer
+        self.shadow_valid = False
+
+    def save_background(self):
+        # current buffer becomes the static layer drawn by restore_background()
+        self.background = framebuf.FrameBuffer(bytearray(self.buffer), self.width, self.height, framebuf.MONO_VLSB)
+
+    def restore_background(self):
+        self.blit(self.background, 0, 0)
+
+    def page_changed(self, page):
+        start = page * self.width
+        end = start + self.width
+        return self.buffer[start:end] != self.shadow[start:end]
+
     def show(self):
+        # send runs of changed 8 pixel row pages only
+        pages = self.pages
+        page = 0
+        while page < pages:
+            if self.shadow_valid and not self.page_changed(page):
+                page += 1
+                continue
+            last = page
+            while last + 1 < pages and (not self.shadow_valid or self.page_changed(last + 1)):
+                last += 1
+            self.show_pages(page, last)
+            start = page * self.width
+            end = (last + 1) * self.width
+            self.shadow[start:end] = self.buffer[start:end]
+            page = last + 1
+        self.shadow_valid = True
+
+    def show_pages(self, first, last):
         x0 = 0
         x1 = self.width - 1
         if self.width != 128:
@@ -106,9 +144,9 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(x0)
         self.write_cmd(x1)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmd(first)
+        self.write_cmd(last)
+        self.write_data(memoryview(self.buffer)[first * self.width:(last + 1) * self.width])
 
 
 class SSD1306_I2C(SSD1306):
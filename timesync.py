@@ -0,0 +1,192 @@
+# UTC wall clock synced from NTP with drift compensation, local time with a UTC offset and DST rule,
+# and a monotonic clock for durations that NTP corrections can't move
+
+import _thread
+import utime
+import jitter
+from machine import RTC
+
+try:
+    import usocket as socket
+except:
+    import socket
+
+try:
+    import ustruct as struct
+except:
+    import struct
+
+SYNC_INTERVAL_SECONDS = 6 * 3600
+RETRY_SECONDS = 300
+NTP_TIMEOUT_SECONDS = 1
+MIN_DRIFT_INTERVAL_MS = 3600 * 1000  # shorter intervals are too noisy to estimate drift
+MAX_DRIFT_PPM = 500  # larger estimates are rejected (ex. RTC set by something else)
+SYNC_JITTER = 0.1  # sync and retry intervals vary by +/- 10% so devices don't query the server together
+
+# seconds between the NTP epoch (1900) and the port's epoch (2000 on ESP32, 1970 on some ports)
+NTP_DELTA = 3155673600 if utime.gmtime(0)[0] == 2000 else 2208988800
+# 2024-01-01 in the port's epoch, earlier times mean the RTC has not been set since power on
+MIN_VALID_TIME = utime.mktime((2024, 1, 1, 0, 0, 0, 0, 0))
+
+DST_NONE = "none"
+DST_US = "us"  # second Sunday in March 2:00 to first Sunday in November 2:00 local time
+DST_EU = "eu"  # last Sunday in March to last Sunday in October, 1:00 UTC
+
+_lock = _thread.allocate_lock()
+_last_ticks = utime.ticks_ms()
+_elapsed_ms = 0
+
+
+def monotonic_ms() -> int:
+    '''Milliseconds since boot, unlike ticks_ms it doesn't wrap (call at least once every few days)'''
+    global _last_ticks, _elapsed_ms
+    with _lock:
+        now = utime.ticks_ms()
+        _elapsed_ms += utime.ticks_diff(now, _last_ticks)
+        _last_ticks = now
+        return _elapsed_ms
+
+
+def monotonic() -> int:
+    '''Seconds since boot'''
+    return monotonic_ms() // 1000
+
+
+def rtc_ms() -> int:
+    try:
+        return utime.time_ns() // 1000000
+    except AttributeError:
+        return utime.time() * 1000
+
+
+def ntp_ms(host) -> int:
+    '''Queries host and returns the current time in ms since the port's epoch, corrected for half the round trip'''
+    query = bytearray(48)
+    query[0] = 0x1B  # version 3, client
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.settimeout(NTP_TIMEOUT_SECONDS)
+        start = utime.ticks_ms()
+        s.sendto(query, addr)
+        msg = s.recv(48)
+        rtt = utime.ticks_diff(utime.ticks_ms(), start)
+    finally:
+        s.close()
+    seconds, fraction = struct.unpack('!II', msg[40:48])
+    if seconds == 0:
+        raise OSError('invalid NTP response')
+    return (seconds - NTP_DELTA) * 1000 + (fraction * 1000 >> 32) + rtt // 2
+
+
+def sunday(year, month, n) -> int:
+    # day of the month of the nth Sunday (n=-1 for the last Sunday of a 31 day month)
+    if n > 0:
+        weekday = utime.gmtime(utime.mktime((year, month, 1, 0, 0, 0, 0, 0)))[6]  # Monday is 0
+        return 1 + (6 - weekday) % 7 + (n - 1) * 7
+    weekday = utime.gmtime(utime.mktime((year, month, 31, 0, 0, 0, 0, 0)))[6]
+    return 31 - (weekday + 1) % 7
+
+
+def dst_seconds(rule, utc, offset_seconds) -> int:
+    '''Daylight saving adjustment in seconds for utc'''
+    if rule == DST_US:
+        standard = utc + offset_seconds
+        year = utime.gmtime(standard)[0]
+        start = utime.mktime((year, 3, sunday(year, 3, 2), 2, 0, 0, 0, 0))
+        end = utime.mktime((year, 11, sunday(year, 11, 1), 1, 0, 0, 0, 0))  # 2:00 daylight time
+        return 3600 if start <= standard < end else 0
+    if rule == DST_EU:
+        year = utime.gmtime(utc)[0]
+        start = utime.mktime((year, 3, sunday(year, 3, -1), 1, 0, 0, 0, 0))
+        end = utime.mktime((year, 10, sunday(year, 10, -1), 1, 0, 0, 0, 0))
+        return 3600 if start <= utc < end else 0
+    return 0
+
+
+class TimeService:
+    '''
+    Keeps the RTC in UTC.  poll() resyncs from NTP every sync_interval_seconds (retry_seconds after a failure),
+    each query waits at most NTP_TIMEOUT_SECONDS so call it from a thread that can afford that (not local control).
+    The first sync is start_delay_ms after creation.
+    The RTC error found at each sync gives the drift rate, which time() uses to correct the RTC between syncs.
+    '''
+
+    def __init__(self, host, offset_hours=0, dst_rule=DST_NONE, sync_interval_seconds=SYNC_INTERVAL_SECONDS,
+                 retry_seconds=RETRY_SECONDS, start_delay_ms=0):
+        self.host = host
+        self.offset_seconds = int(offset_hours * 3600)
+        self.dst_rule = dst_rule
+        self.sync_interval_ms = sync_interval_seconds * 1000
+        self.retry_ms = retry_seconds * 1000
+        self.next_sync_ms = monotonic_ms() + start_delay_ms  # monotonic_ms of the next sync
+        self.synced_ms = None  # monotonic_ms of the last sync, None before the first sync
+        self.synced_rtc_ms = 0  # RTC time set at the last sync
+        self.drift_ppm = 0  # positive when the RTC runs fast
+        self.last_error_ms = 0  # RTC error corrected at the last sync
+        self.syncs = 0
+        self.failures = 0
+
+    def valid(self) -> bool:
+        '''True once the RTC holds a real date (synced, or set before a soft reset)'''
+        return self.synced_ms is not None or utime.time() >= MIN_VALID_TIME
+
+    def time(self) -> int:
+        '''UTC seconds since the port's epoch with the estimated drift since the last sync removed'''
+        now = rtc_ms()
+        if self.synced_ms is not None and self.drift_ppm:
+            now -= (now - self.synced_rtc_ms) * self.drift_ppm // 1000000
+        return now // 1000
+
+    def localtime(self, utc=None):
+        '''Local time tuple (like utime.localtime) using the UTC offset and DST rule'''
+        if utc is None:
+            utc = self.time()
+        return utime.gmtime(utc + self.offset_seconds + dst_seconds(self.dst_rule, utc, self.offset_seconds))
+
+    def to_monotonic(self, utc) -> int:
+        return monotonic() - (self.time() - utc)
+
+    def to_utc(self, seconds):
+        '''Converts monotonic seconds to UTC, None if the clock isn't valid'''
+        if not self.valid():
+            return None
+        return self.time() - (monotonic() - seconds)
+
+    def poll(self) -> bool:
+        '''Syncs if due, returns True after a successful sync'''
+        if monotonic_ms() < self.next_sync_ms:
+            return False
+        try:
+            self.sync()
+        except Exception as e:
+            self.failures += 1
+            self.next_sync_ms = monotonic_ms() + jitter.jittered(self.retry_ms, SYNC_JITTER)
+            print('NTP failed: {0}'.format(e))
+            return False
+        self.next_sync_ms = monotonic_ms() + jitter.jittered(self.sync_interval_ms, SYNC_JITTER)
+        return True
+
+    def sync(self):
+        ntp = ntp_ms(self.host)
+        now = monotonic_ms()
+        rtc = rtc_ms()
+        self.last_error_ms = rtc - ntp
+        if self.synced_ms is not None and now - self.synced_ms >= MIN_DRIFT_INTERVAL_MS:
+            ppm = self.last_error_ms * 1000000 // (now - self.synced_ms)
+            if abs(ppm) <= MAX_DRIFT_PPM:
+                # smooth the estimate, a single sync has up to a round trip of error
+                self.drift_ppm = ppm if not self.drift_ppm else (self.drift_ppm * 3 + ppm) // 4
+        tm = utime.gmtime(ntp // 1000)
+        RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], (ntp % 1000) * 1000))
+        self.synced_ms = now
+        self.synced_rtc_ms = ntp
+        self.syncs += 1
+        t = self.localtime()
+        print('NTP synced, RTC error {0} ms, drift {1} ppm, local time {2}/{3:02d}/{4:02d} {5:02d}:{6:02d}:{7:02d}'.format(
+            self.last_error_ms, self.drift_ppm, t[0], t[1], t[2], t[3], t[4], t[5]))
+
+    def to_json(self) -> bytes:
+        return b'{{"utc":{0},"synced":{1},"syncs":{2},"failures":{3},"error_ms":{4},"drift_ppm":{5}}}'.format(
+            self.time(), 'true' if self.synced_ms is not None else 'false', self.syncs, self.failures,
+            self.last_error_ms, self.drift_ppm)
@@ -0,0 +1,154 @@
+# Host benchmark of the web page: the original web_page() string concatenation and its send calls against the
+# static chunks streamed by webpage.send_page().  Sends go to a socket stand-in that records when the first byte
+# was handed over (time to first byte), the number of send calls and the bytes sent.  Besides the time, the peak
+# heap used for one request is reported, and the style sheet size with and without build.sh's gzip:
+#   python3 tools/bench_page.py [--count 20000]
+
+import argparse
+import gzip
+import time
+import tracemalloc
+
+import hostshim  # puts the repository on sys.path
+import webpage
+
+# values of the page's dynamic slots (see app.web_page_values)
+TEMPERATURE = '71.6'
+HUMIDITY = '41.3 (43.0 bathroom)'
+DESIRED = '40'
+MODE = 'Auto'
+GPIO_STATE = 'OFF'
+MSG = 'last off 2 min ago'
+
+
+class Conn:
+    '''Socket stand-in'''
+
+    def __init__(self):
+        self.first = None
+        self.calls = 0
+        self.size = 0
+
+    def send(self, data):
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.calls += 1
+        self.size += len(data)
+        return len(data)
+
+    sendall = send
+
+
+def web_page():
+    # main.py before the change (the style sheet was part of the page)
+    humidity_curr_string = HUMIDITY
+    html = """<html>
+
+<head>
+    <title>Humidity Switch #1</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        html {
+            font-family: Arial;
+            display: inline-block;
+            margin: 0px auto;
+            text-align: center;
+        }
+
+        .button {
+            background-color: #ce1b0e;
+            border: none;
+            color: white;
+            padding: 16px 40px;
+            text-align: center;
+            text-decoration: none;
+            display: inline-block;
+            font-size: 16px;
+            margin: 4px 2px;
+            cursor: pointer;
+        }
+
+        .button1 {
+            background-color: #000000;
+        }
+    </style>
+</head>
+
+<body>
+    <h2>ESP MicroPython Web Server</h2>
+    <p>Current Temperature: <strong>""" + TEMPERATURE + """</strong></p>
+    <p>Current Humity: <strong>""" + humidity_curr_string + """</strong></p>
+    <p>Desired Humity: <strong>""" + str(int(DESIRED)) + """</strong></p>
+    <p>Mode: """ + MODE + """</p>
+    <p>GPIO state: <strong>""" + GPIO_STATE + """</strong></p>
+    <p><strong>""" + MSG + """</strong></p>
+    <p><strong><a href=\".\">refresh</a></strong></p>
+    <p>
+        <a href=\"?gpioSwitch=on\"><button class="button">GPIO ON</button></a>
+    </p>
+    <p>
+        <a href=\"?gpioSwitch=off\"><button class="button button1">GPIO OFF</button></a>
+    </p>
+    <form action="/" method="POST"><center>
+      <input type="text" name="set_humidity" placeholder="set_humidity"><br>
+      <left><button type="submit">Submit</button></left>
+    </center></form>
+</body>
+
+</html>"""
+    return html
+
+
+def send_concatenated(conn):
+    response = web_page()
+    conn.send('HTTP/1.1 200 OK\n')
+    conn.send('Content-Type: text/html\n')
+    conn.send('Connection: close\n\n')
+    conn.sendall(response)
+
+
+def send_streamed(conn):
+    # app.send_web_page with its headers sent by httpserver.send_response
+    values = [value.encode() for value in (TEMPERATURE, HUMIDITY, DESIRED, MODE, GPIO_STATE, MSG)]
+    length = webpage.PAGE_LENGTH + sum([len(value) for value in values])
+    conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: %d\r\nConnection: keep-alive\r\n'
+                 b'ETag: %s\r\nCache-Control: no-cache\r\n\r\n' % (length, b'"123-4"'))
+    webpage.send_page(conn, values)
+
+
+def bench(send, count):
+    '''(microseconds to the first byte, microseconds per request, send calls, bytes) averaged over count requests'''
+    first = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        conn = Conn()
+        started = time.perf_counter()
+        send(conn)
+        first += conn.first - started
+    total = time.perf_counter() - start
+    return first * 1000000 / count, total * 1000000 / count, conn.calls, conn.size
+
+
+def peak_bytes(send) -> int:
+    send(Conn())
+    tracemalloc.start()
+    send(Conn())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+    for name, send in (('concatenated', send_concatenated), ('streamed', send_streamed)):
+        first, total, calls, size = bench(send, args.count)
+        print('%-12s first byte %5.2f us, request %5.2f us, %2d sends, %4d bytes, peak heap %5d bytes' % (
+            name, first, total, calls, size, peak_bytes(send)))
+    print('style.css   %d bytes, %d gzipped (sent once, then cached by the browser)' % (
+        len(webpage.STYLE_CSS), len(gzip.compress(webpage.STYLE_CSS, 9, mtime=0))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Host benchmark of the remote humidity parse in sub_cb: the original regex on str(msg) against payload.parse_field.
+# MicroPython's re has no pattern cache, so the original compiled the pattern for every message; CPython caches
+# compiled patterns, the cache is purged here to match.  Besides the time, the peak heap used while parsing one
+# message is reported (parse_field only allocates the returned float):
+#   python3 tools/bench_parse.py [--count 20000]
+
+import argparse
+import re
+import time
+import tracemalloc
+
+import hostshim  # puts the repository on sys.path
+import payload
+
+MESSAGES = (
+    b'{"s":"-61","t":"21.4","h":"41.3","r":"0","d":"40"}',
+    b'{"s":-61,"t":21.4,"h":41.3,"r":0,"d":40}',
+    b'{"s":"-61","t":"21.4","h":"41.3","r":"0","d":"40","n":"118","a":"1432"}',
+)
+
+
+def parse_regex(msg):
+    # sub_cb before the change
+    re.purge()
+    re_humidity_val = re.compile("h\":\"(.+?)\"")
+    m = re_humidity_val.search(str(msg))
+    if m:
+        return round(float(m.group(1)), 1)
+    return None
+
+
+def parse_bytes(msg):
+    return payload.parse_field(msg, payload.KEY_HUMIDITY)
+
+
+def bench(parse, msg, count) -> float:
+    '''Microseconds per message'''
+    start = time.perf_counter()
+    for _ in range(count):
+        parse(msg)
+    return (time.perf_counter() - start) * 1000000 / count
+
+
+def peak_bytes(parse, msg) -> int:
+    parse(msg)  # imports and first-call caches aren't counted
+    tracemalloc.start()
+    parse(msg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+    for msg in MESSAGES:
+        before = bench(parse_regex, msg, args.count)
+        after = bench(parse_bytes, msg, args.count)
+        print(msg.decode())
+        print('  regex        %6.2f us, peak %5d bytes -> %s' % (before, peak_bytes(parse_regex, msg), parse_regex(msg)))
+        print('  parse_field  %6.2f us, peak %5d bytes -> %s  (%.1fx faster)' % (
+            after, peak_bytes(parse_bytes, msg), parse_bytes(msg), before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# Host simulation of a fleet sharing one broker: every device boots at once (power restored), then the broker
+# goes down and comes back.  Runs the device's schedule (schedules.py: intervals, first report offsets and the MQTT
+# backoff) on a simulated clock, and reports the peak messages per second and the connection burst with and
+# without the per-device spread.
+#   python3 tools/fleet_sim.py [--devices 200] [--outage 600] [--seed 1]
+
+import argparse
+import heapq
+import random
+
+import hostshim
+
+
+class Clock:
+    '''Simulated time for utime, set to each event's time before the device code runs'''
+    ms = 0
+
+    def __call__(self):
+        return self.ms / 1000
+
+
+clock = Clock()
+hostshim.install(clock)
+
+import jitter
+import schedules
+from schedules import (HUMIDITY_EVALUATION_INTERVAL_SECONDS, MQTT_REPORTING_INTERVAL_SECONDS,
+                       HEALTH_REPORTING_INTERVAL_SECONDS, WIFI_START_SPREAD_MS, WIFI_POLL_MS)
+
+WIFI_CONNECT_MS = (1000, 3000)  # association and DHCP time, picked at random per device
+
+OUTAGE_START_SECONDS = 3600
+RUN_SECONDS = 7200
+
+
+class Broker:
+    '''Stand-in for the broker, counts connection attempts and messages per second'''
+
+    def __init__(self, down_from, down_until):
+        self.down_from = down_from
+        self.down_until = down_until
+        self.connects = {}
+        self.messages = {}
+
+    def up(self, ms) -> bool:
+        return not self.down_from <= ms < self.down_until
+
+    def connect(self, ms) -> bool:
+        second = ms // 1000
+        self.connects[second] = self.connects.get(second, 0) + 1
+        return self.up(ms)
+
+    def publish(self, ms, count=1):
+        second = ms // 1000
+        self.messages[second] = self.messages.get(second, 0) + count
+
+
+class Device:
+    '''Created at boot (clock at 0), with the schedule humidistat_thread and network_thread start from'''
+
+    def __init__(self, client_id, rng):
+        self.client_id = client_id
+        self.connected = False
+        self.backoff = schedules.mqtt_backoff(client_id)
+        self.publish_state = True
+        self.wifi_up_ms = jitter.offset(client_id, WIFI_START_SPREAD_MS) + rng.randint(*WIFI_CONNECT_MS)
+        self.last_mqtt_s, self.last_report_s = schedules.first_reports(client_id, 0)
+        self.evaluation_phase_ms = schedules.evaluation_phase_ms(client_id)
+
+    def next_poll(self, ms) -> int:
+        # network_thread polls every WIFI_POLL_MS from the time WiFi came up, mqtt_poll() connects once due
+        due = ms + self.backoff.remaining_ms()
+        polls = -(-(due - self.wifi_up_ms) // WIFI_POLL_MS)
+        return self.wifi_up_ms + polls * WIFI_POLL_MS
+
+
+def simulate(count, outage_seconds, seed, spread):
+    rng = random.Random(seed)
+    if not spread:
+        saved = jitter.offset, jitter.jittered
+        jitter.offset = lambda device_id, period: 0
+        jitter.jittered = lambda value, fraction=0.1: value
+    try:
+        broker = Broker(OUTAGE_START_SECONDS * 1000, (OUTAGE_START_SECONDS + outage_seconds) * 1000)
+        events = []  # (ms, order, kind, device)
+        order = 0
+        clock.ms = 0
+        for _ in range(count):
+            # like ubinascii.hexlify(machine.unique_id())
+            device = Device(b'%012x' % rng.getrandbits(48), rng)
+            order += 1
+            heapq.heappush(events, (device.next_poll(device.wifi_up_ms), order, 'mqtt', device))
+            order += 1
+            heapq.heappush(events, (0, order, 'evaluate', device))
+
+        while events:
+            ms, _, kind, device = heapq.heappop(events)
+            if ms >= RUN_SECONDS * 1000:
+                break
+            clock.ms = ms
+            order += 1
+            if kind == 'mqtt':
+                # app.mqtt_poll() on network_thread
+                if not device.backoff.due():
+                    heapq.heappush(events, (device.next_poll(ms), order, 'mqtt', device))
+                elif broker.connect(ms):
+                    device.connected = True
+                    device.backoff.succeeded()
+                    device.publish_state = True
+                else:
+                    device.backoff.failed()
+                    heapq.heappush(events, (device.next_poll(ms), order, 'mqtt', device))
+                continue
+
+            # humidistat_thread evaluation
+            seconds = ms // 1000
+            heapq.heappush(events, (ms + HUMIDITY_EVALUATION_INTERVAL_SECONDS * 1000 + device.evaluation_phase_ms,
+                                    order, 'evaluate', device))
+            device.evaluation_phase_ms = 0
+            if not device.connected:
+                continue
+            if not broker.up(ms):
+                # check_msg fails on the dead connection (app.mqtt_disconnect), network_thread reconnects after the backoff
+                device.connected = False
+                device.backoff.failed()
+                order += 1
+                heapq.heappush(events, (device.next_poll(ms), order, 'mqtt', device))
+                continue
+            if device.publish_state:
+                broker.publish(ms)
+                device.publish_state = False
+            if seconds > 0 and seconds - device.last_mqtt_s >= MQTT_REPORTING_INTERVAL_SECONDS:
+                broker.publish(ms)
+                device.last_mqtt_s = seconds
+            if seconds - device.last_report_s >= HEALTH_REPORTING_INTERVAL_SECONDS:
+                broker.publish(ms, 2)  # memory and perf
+                device.last_report_s = seconds
+        return broker
+    finally:
+        if not spread:
+            jitter.offset, jitter.jittered = saved
+
+
+def peak(counts, start, end):
+    window = [(n, second) for second, n in counts.items() if start <= second < end]
+    return max(window) if window else (0, start)
+
+
+def report(name, broker, count, outage_seconds):
+    recovery = OUTAGE_START_SECONDS + outage_seconds
+    boot_connects, boot_connects_at = peak(broker.connects, 0, 600)
+    boot_messages, _ = peak(broker.messages, 0, 600)
+    steady_messages, _ = peak(broker.messages, 600, OUTAGE_START_SECONDS)
+    burst, burst_at = peak(broker.connects, recovery, RUN_SECONDS)
+    after_messages, _ = peak(broker.messages, recovery, RUN_SECONDS)
+    print('%s (%d devices)' % (name, count))
+    print('  boot: peak %d MQTT connects/s (at %d s), peak %d messages/s' % (boot_connects, boot_connects_at, boot_messages))
+    print('  steady state: peak %d messages/s' % steady_messages)
+    print('  after a %d s broker outage: reconnect burst %d MQTT connects/s (%d s after recovery), peak %d messages/s,'
+          ' %d connects during the outage' % (
+              outage_seconds, burst, burst_at - recovery, after_messages,
+              sum(n for second, n in broker.connects.items() if OUTAGE_START_SECONDS <= second < recovery)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--outage', type=int, default=600, help='broker outage in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)  # jitter.jittered draws from the random module
+    report('per-device offsets and jitter', simulate(args.devices, args.outage, args.seed, True),
+           args.devices, args.outage)
+    report('no spread (every device on the same schedule)', simulate(args.devices, args.outage, args.seed, False),
+           args.devices, args.outage)
+
+
+if __name__ == '__main__':
+    main()
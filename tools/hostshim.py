@@ -0,0 +1,120 @@
+# Runs the device modules under CPython for the host scripts in this directory:
+# a utime module with wrapping ticks, socket.readinto and a select.poll that returns socket objects like MicroPython's
+
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TICKS_PERIOD = 1 << 30  # MicroPython's ticks_ms wraps at 2**30
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+def _make_utime(clock):
+    utime = types.ModuleType('utime')
+    utime.ticks_ms = lambda: int(clock() * 1000) % TICKS_PERIOD
+    utime.ticks_us = lambda: int(clock() * 1000000) % TICKS_PERIOD
+    utime.ticks_add = lambda ticks, delta: (ticks + delta) % TICKS_PERIOD
+    utime.ticks_diff = lambda a, b: (a - b + TICKS_HALF) % TICKS_PERIOD - TICKS_HALF
+    utime.sleep = time.sleep
+    utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    utime.time = time.time
+    utime.localtime = time.localtime
+    utime.gmtime = time.gmtime
+    utime.mktime = lambda t: int(time.mktime(tuple(t) + (0,) * (9 - len(t))))
+    return utime
+
+
+def install(clock=time.monotonic):
+    '''Registers utime (driven by clock, seconds as a float) before the device modules are imported'''
+    sys.modules['utime'] = _make_utime(clock)
+    socket.socket.readinto = lambda self, buf: self.recv_into(buf)
+
+
+class _Poll:
+    # CPython's poll() returns file descriptors, MicroPython's returns the registered objects
+    # and unregister() also accepts an object that was closed since (its fileno() is then -1)
+    def __init__(self):
+        self._poll = select.poll()
+        self.objects = {}  # fd -> object
+        self.fds = {}  # object -> fd
+
+    def register(self, obj, mask):
+        fd = obj.fileno()
+        self.objects[fd] = obj
+        self.fds[obj] = fd
+        self._poll.register(fd, mask)
+
+    def unregister(self, obj):
+        fd = self.fds.pop(obj)
+        del self.objects[fd]
+        self._poll.unregister(fd)
+
+    def poll(self, timeout_ms=-1):
+        return [(self.objects[fd], event) for fd, event in self._poll.poll(timeout_ms) if fd in self.objects]
+
+
+def patch_select(module):
+    '''Replaces select in an imported device module (ex. httpserver)'''
+    module.select = types.SimpleNamespace(poll=_Poll, POLLIN=select.POLLIN, POLLOUT=select.POLLOUT,
+                                          POLLHUP=select.POLLHUP, POLLERR=select.POLLERR)
+
+
+def quiet(module):
+    '''Silences the print() calls of a device module'''
+    module.print = lambda *args, **kwargs: None
+
+
+def start_server(routes, **kwargs):
+    '''Runs httpserver.HTTPServer on an ephemeral port in a daemon thread (server.thread), returns (server, port)'''
+    install()
+    import httpserver
+    patch_select(httpserver)
+    quiet(httpserver)
+    server = httpserver.HTTPServer(routes, port=0, **kwargs)
+    port = server.sock.getsockname()[1]
+    server.thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server.thread.start()
+    return server, port
+
+
+def connect(port, timeout=10):
+    return socket.create_connection(('127.0.0.1', port), timeout=timeout)
+
+
+def read_response(sock, pending=b''):
+    '''
+    Reads one response, returns (status, headers, body, leftover bytes) or None if the connection closed first.
+    The body is read by Content-Length, or to the end of the connection without one.
+    '''
+    data = pending
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    head, _, data = data.partition(b'\r\n\r\n')
+    lines = head.decode().split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        while len(data) < length:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return status, headers, data[:length], data[length:]
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return status, headers, data, b''
+        data += chunk
@@ -0,0 +1,238 @@
+# Host fuzz and throughput test for httpserver's incremental parser: requests split at random points,
+# pipelined keep-alive requests, buffer-size boundaries, malformed and random requests.
+#   python3 tools/http_fuzz.py [--seed 1] [--rounds 200]
+
+import argparse
+import random
+import socket
+import time
+
+import hostshim
+
+MAX_CLIENTS = 4
+MAX_REQUEST_SIZE = 2048
+KEEPALIVE_REQUESTS = 20
+
+failures = []
+
+
+def check(condition, message):
+    print('%s %s' % ('ok  ' if condition else 'FAIL', message))
+    if not condition:
+        failures.append(message)
+
+
+def handle_echo(conn, request):
+    # echoes the method, path, parameters and body so the client can compare them with what it sent
+    import httpserver
+    params = request.params()
+    body = b'%s %s %s\n%s' % (request.method.encode(), request.path.encode(),
+                              ','.join(['%s=%s' % (k, params[k]) for k in sorted(params)]).encode(), request.body)
+    httpserver.send_response(conn, request, b'text/plain', len(body))
+    conn.sendall(body)
+
+
+def echo_request(rng, path='/echo'):
+    '''Random request for handle_echo, returns (request bytes, expected response body)'''
+    value = ''.join(rng.choice('abc123') for _ in range(rng.randint(0, 20)))
+    query = 'q=%s' % value
+    if rng.random() < 0.5:
+        return b'GET %s?%s HTTP/1.1\r\nHost: test\r\n\r\n' % (path.encode(), query.encode()), \
+            b'GET %s q=%s\n' % (path.encode(), value.encode())
+    body = ('f=%s' % value).encode()
+    request = b'POST %s HTTP/1.1\r\nHost: test\r\nContent-Type: application/x-www-form-urlencoded\r\n' \
+              b'Content-Length: %d\r\n\r\n%s' % (path.encode(), len(body), body)
+    return request, b'POST %s f=%s\n%s' % (path.encode(), value.encode(), body)
+
+
+def connect(port):
+    sock = hostshim.connect(port)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def send_segments(sock, data, cuts):
+    # sends data split at the cut offsets with a pause in between, so the server reads each part separately
+    last = 0
+    for cut in sorted(cuts) + [len(data)]:
+        if cut > last:
+            sock.sendall(data[last:cut])
+            time.sleep(0.002)
+        last = cut
+
+
+def segmented(port, rng, rounds):
+    ok = 0
+    for _ in range(rounds):
+        request, expected = echo_request(rng)
+        cuts = rng.sample(range(1, len(request)), min(rng.randint(1, 6), len(request) - 1))
+        sock = connect(port)
+        send_segments(sock, request, cuts)
+        response = hostshim.read_response(sock)
+        sock.close()
+        ok += response is not None and response[0] == 200 and response[2] == expected
+    check(ok == rounds, '%d/%d requests split at random points parsed correctly' % (ok, rounds))
+
+    # the blank line ending the headers split at every position
+    request, expected = echo_request(random.Random(0))
+    end = request.index(b'\r\n\r\n')
+    ok = 0
+    for cut in range(end - 2, end + 5):
+        sock = connect(port)
+        send_segments(sock, request, [cut])
+        response = hostshim.read_response(sock)
+        sock.close()
+        ok += response is not None and response[2] == expected
+    check(ok == 7, 'header terminator split at every offset (%d/7)' % ok)
+
+
+def pipelined(port, rng, rounds):
+    ok = 0
+    for _ in range(rounds):
+        pairs = [echo_request(rng) for _ in range(rng.randint(2, 5))]
+        data = b''.join([request for request, _ in pairs])
+        cuts = rng.sample(range(1, len(data)), rng.randint(0, 4))
+        sock = connect(port)
+        send_segments(sock, data, cuts)
+        pending = b''
+        good = True
+        for _, expected in pairs:
+            response = hostshim.read_response(sock, pending)
+            if response is None or response[2] != expected or response[1].get('connection') != 'keep-alive':
+                good = False
+                break
+            pending = response[3]
+        sock.close()
+        ok += good
+    check(ok == rounds, '%d/%d pipelined keep-alive batches answered in order' % (ok, rounds))
+
+
+def keepalive_limit(port):
+    sock = connect(port)
+    request, expected = echo_request(random.Random(1))
+    connections = []
+    for _ in range(KEEPALIVE_REQUESTS):
+        sock.sendall(request)
+        response = hostshim.read_response(sock)
+        connections.append(response and response[1].get('connection'))
+    closed = sock.recv(1) == b''
+    sock.close()
+    check(connections == ['keep-alive'] * (KEEPALIVE_REQUESTS - 1) + ['close'] and closed,
+          'connection closed after %d keep-alive requests' % KEEPALIVE_REQUESTS)
+
+
+def status_of(port, data):
+    sock = connect(port)
+    try:
+        sock.sendall(data)
+        response = hostshim.read_response(sock)
+        return response and response[0]
+    except ConnectionResetError:
+        return 'reset'
+    finally:
+        sock.close()
+
+
+def boundaries(port):
+    head = b'POST /echo HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n'
+    # body filling the buffer exactly fits, one more byte doesn't
+    fill = MAX_REQUEST_SIZE - len(head % 1000)
+    check(status_of(port, head % fill + b'x' * fill) == 200, 'request exactly the buffer size is served')
+    check(status_of(port, head % (fill + 1) + b'x' * (fill + 1)) == 413, 'one byte over the buffer gets 413')
+    check(status_of(port, b'GET /echo HTTP/1.1\r\nX: %s\r\n\r\n' % (b'a' * MAX_REQUEST_SIZE)) == 413,
+          'headers without an end within the buffer get 413')
+    check(status_of(port, head.replace(b'%d', b'-1')) == 413, 'negative Content-Length gets 413')
+
+
+def malformed(port):
+    cases = [
+        (b'GET /echo\r\n\r\n', 400),
+        (b'GET /echo FTP/1.0\r\n\r\n', 400),
+        (b'GET  /echo HTTP/1.1\r\n\r\n', 400),
+        (b'GET /echo HTTP/1.1\r\nno colon\r\n\r\n', 400),
+        (b'GET /echo HTTP/1.1\r\nX: \xff\xfe\r\n\r\n', 400),
+        (b'POST /echo HTTP/1.1\r\nContent-Length: ten\r\n\r\n', 400),
+        (b'GET /missing HTTP/1.1\r\n\r\n', 404),
+        (b'DELETE /echo HTTP/1.1\r\n\r\n', 405),
+    ]
+    for data, expected in cases:
+        status = status_of(port, data)
+        check(status == expected, '%r -> %s' % (data[:40], status))
+
+
+def random_requests(port, rng, rounds):
+    statuses = {}
+    for _ in range(rounds):
+        if rng.random() < 0.5:
+            data = bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 200)))
+        else:
+            # a valid request with a few bytes flipped
+            data = bytearray(echo_request(rng)[0])
+            for _ in range(rng.randint(1, 4)):
+                data[rng.randrange(len(data))] = rng.getrandbits(8)
+            data = bytes(data)
+        if b'\r\n\r\n' not in data:
+            data += b'\r\n\r\n'
+        status = status_of(port, data)
+        statuses[status] = statuses.get(status, 0) + 1
+    print('random requests: %s' % statuses)
+    check(set(statuses) <= {200, 400, 404, 405, 413}, 'random requests only get 200/400/404/405/413')
+
+
+def throughput(port, count):
+    request, expected = echo_request(random.Random(2))
+    start = time.monotonic()
+    served = 0
+    sock = None
+    while served < count:
+        if sock is None:
+            sock = connect(port)
+        sock.sendall(request)
+        response = hostshim.read_response(sock)
+        served += 1
+        if response[1].get('connection') == 'close':
+            sock.close()
+            sock = None
+    elapsed = time.monotonic() - start
+
+    batch = 10
+    start = time.monotonic()
+    for _ in range(count // batch):
+        sock = connect(port)
+        sock.sendall(request * batch)
+        pending = b''
+        for _ in range(batch):
+            response = hostshim.read_response(sock, pending)
+            pending = response[3]
+        sock.close()
+    pipelined_elapsed = time.monotonic() - start
+    print('throughput: %.0f req/s keep-alive, %.0f req/s pipelined (%d requests each)' % (
+        count / elapsed, count // batch * batch / pipelined_elapsed, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    server, port = hostshim.start_server({('GET', '/echo'): handle_echo, ('POST', '/echo'): handle_echo},
+                                         max_clients=MAX_CLIENTS, max_request_size=MAX_REQUEST_SIZE,
+                                         keepalive_requests=KEEPALIVE_REQUESTS, tick_ms=50)
+    segmented(port, rng, args.rounds)
+    pipelined(port, rng, args.rounds)
+    keepalive_limit(port)
+    boundaries(port)
+    malformed(port)
+    random_requests(port, rng, args.rounds)
+    check(server.thread.is_alive(), 'server thread still running')
+    check(len(server.buffers) == MAX_CLIENTS, 'every buffer returned to the pool')
+    throughput(port, 1000)
+    if failures:
+        print('%d checks failed' % len(failures))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
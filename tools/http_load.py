@@ -0,0 +1,149 @@
+# Host load test for httpserver.HTTPServer: slow clients, the connection cap and many concurrent clients.
+# Runs the server under CPython (see hostshim.py) with the device's buffer sizes and short timeouts:
+#   python3 tools/http_load.py [--clients 50] [--requests 20]
+
+import argparse
+import threading
+import time
+
+import hostshim
+
+MAX_CLIENTS = 4
+MAX_REQUEST_SIZE = 2048
+READ_TIMEOUT_MS = 500
+BODY = b'ok'
+
+failures = []
+
+
+def check(condition, message):
+    print('%s %s' % ('ok  ' if condition else 'FAIL', message))
+    if not condition:
+        failures.append(message)
+
+
+def handle_root(conn, request):
+    import httpserver
+    httpserver.send_response(conn, request, b'text/plain', len(BODY))
+    conn.sendall(BODY)
+
+
+def get(port, headers=b''):
+    sock = hostshim.connect(port)
+    try:
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: test\r\nConnection: close\r\n%s\r\n' % headers)
+        return hostshim.read_response(sock)
+    finally:
+        sock.close()
+
+
+def slow_clients(port):
+    # fill every buffer with clients that never finish their headers
+    slow = []
+    for _ in range(MAX_CLIENTS - 1):
+        sock = hostshim.connect(port)
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: test\r\n')
+        slow.append(sock)
+    trickle = hostshim.connect(port)
+    slow.append(trickle)
+    time.sleep(0.2)
+
+    # connections beyond the cap are rejected right away instead of waiting.  The 503 is sent on accept, these
+    # clients read it before sending (a request still unread when the server closes makes it send a reset)
+    start = time.monotonic()
+    busy = []
+    for _ in range(6):
+        sock = hostshim.connect(port)
+        busy.append(hostshim.read_response(sock))
+        sock.close()
+    elapsed = time.monotonic() - start
+    check(all(r and r[0] == 503 for r in busy), '6 clients over the cap get 503 (%s)' % [r and r[0] for r in busy])
+    check(elapsed < READ_TIMEOUT_MS / 1000, '503s sent without waiting for the slow clients (%.0f ms)' % (elapsed * 1000))
+
+    # a client trickling a byte at a time doesn't extend its deadline (it is closed part way through)
+    for c in b'GET / HTTP/1.1\r\n':
+        try:
+            trickle.sendall(bytes([c]))
+        except OSError:
+            break
+        time.sleep(0.05)
+
+    statuses = []
+    for sock in slow:
+        response = hostshim.read_response(sock)
+        statuses.append(response and response[0])
+        sock.close()
+    elapsed = time.monotonic() - start
+    check(statuses == [408] * MAX_CLIENTS, 'slow and trickling clients get 408 (%s)' % statuses)
+    check(elapsed < READ_TIMEOUT_MS / 1000 + 1.5, '408s within the read timeout (%.0f ms)' % (elapsed * 1000))
+
+    # buffers are returned once the slow clients are gone
+    response = get(port)
+    check(response is not None and response[0] == 200, 'normal request served after the timeouts')
+
+
+def oversized(port):
+    response = get(port, b'X-Padding: %s\r\n' % (b'a' * MAX_REQUEST_SIZE))
+    check(response is not None and response[0] == 413, 'headers larger than the buffer get 413')
+    sock = hostshim.connect(port)
+    sock.sendall(b'POST / HTTP/1.1\r\nHost: test\r\nContent-Length: 100000\r\n\r\n')
+    response = hostshim.read_response(sock)
+    sock.close()
+    check(response is not None and response[0] == 413, 'Content-Length larger than the buffer gets 413')
+
+
+def concurrent(port, clients, requests):
+    counts = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(requests):
+            start = time.monotonic()
+            try:
+                response = get(port)
+                status = response[0] if response else 'closed'
+            except ConnectionResetError:
+                # rejected with 503 and closed before the request was read (the 503 may be lost to the reset)
+                status = 'reset'
+            except OSError as e:
+                status = type(e).__name__
+            with lock:
+                counts[status] = counts.get(status, 0) + 1
+                latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    total = clients * requests
+    print('%d clients x %d requests: %s in %.2f s (%.0f req/s), latency p50 %.1f ms, p99 %.1f ms' % (
+        clients, requests, counts, elapsed, total / elapsed,
+        latencies[len(latencies) // 2] * 1000, latencies[len(latencies) * 99 // 100] * 1000))
+    check(set(counts) <= {200, 503, 'reset'}, 'every concurrent request gets 200 or is rejected')
+    check(counts.get(200, 0) > 0, 'concurrent requests are served')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    _, port = hostshim.start_server({('GET', '/'): handle_root, ('POST', '/'): handle_root},
+                                    max_clients=MAX_CLIENTS, max_request_size=MAX_REQUEST_SIZE,
+                                    read_timeout_ms=READ_TIMEOUT_MS, tick_ms=50)
+    slow_clients(port)
+    oversized(port)
+    concurrent(port, args.clients, args.requests)
+    if failures:
+        print('%d checks failed' % len(failures))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Hardware watchdog fed only while every registered task is sending heartbeats
+
+import machine
+import utime
+
+TIMEOUT_MS = 30000  # hardware watchdog timeout, the board resets this long after the last feed
+RTC_TAG = b'WD:'  # RTC memory prefix for the name of the stalled task (survives the watchdog reset)
+
+
+def last_stall():
+    '''Name of the task that stalled before the last reset (None if there wasn't one), clears the record'''
+    rtc = machine.RTC()
+    mem = rtc.memory()
+    if not mem.startswith(RTC_TAG):
+        return None
+    rtc.memory(b'')
+    return mem[len(RTC_TAG):].decode()
+
+
+class Watchdog:
+    '''
+    Tasks register with the longest time they can go without a heartbeat and call beat() from their loop.
+    check() (called every second or so from one place) feeds machine.WDT only while every task is within its limit.
+    The first stalled task is written to RTC memory, and the hardware watchdog resets the board timeout_ms later.
+    Use suspend() and resume() around light sleep, the heartbeats are reset on resume.
+    '''
+
+    def __init__(self, timeout_ms=TIMEOUT_MS):
+        self.timeout_ms = timeout_ms
+        self.wdt = None
+        self.tasks = {}  # name -> [last heartbeat ticks_ms, max silence ms]
+        self.stalled = None
+        self.suspended = False
+        self.previous = last_stall()  # task that stalled before this boot
+
+    def register(self, name, max_silence_ms):
+        self.tasks[name] = [utime.ticks_ms(), max_silence_ms]
+
+    def beat(self, name):
+        task = self.tasks.get(name)
+        if task:
+            task[0] = utime.ticks_ms()
+
+    def start(self):
+        self.wdt = machine.WDT(timeout=self.timeout_ms)
+
+    def suspend(self):
+        self.suspended = True
+
+    def resume(self):
+        now = utime.ticks_ms()
+        for task in self.tasks.values():
+            task[0] = now
+        self.suspended = False
+
+    def check(self):
+        '''Feeds the watchdog if all tasks are healthy, returns the name of a stalled task otherwise'''
+        if self.stalled:
+            return self.stalled
+        if not self.suspended:
+            now = utime.ticks_ms()
+            for name, task in self.tasks.items():
+                if utime.ticks_diff(now, task[0]) > task[1]:
+                    self.stalled = name
+                    print('watchdog: %s stalled for %d ms, reset in %d ms' % (name, utime.ticks_diff(now, task[0]), self.timeout_ms))
+                    machine.RTC().memory(RTC_TAG + name.encode())
+                    return name
+        if self.wdt:
+            self.wdt.feed()
+        return None
+
+    def to_json(self) -> bytes:
+        now = utime.ticks_ms()
+        ages = b','.join([b'"%s":%d' % (name.encode(), utime.ticks_diff(now, task[0])) for name, task in self.tasks.items()])
+        return b'{"tasks":{%s},"stalled":"%s","previous":"%s"}' % (
+            ages, (self.stalled or '').encode(), (self.previous or '').encode())
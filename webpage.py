@@ -0,0 +1,116 @@
+# Web page and style sheet served by app.py
+#
+# The page is kept as bytes chunks with the dynamic values (see app.web_page_values) sent between them, so nothing
+# is built per request.  When this module is frozen into the firmware the literals stay in flash instead of RAM.
+
+PAGE_CHUNKS = (
+b"""<html>
+
+<head>
+    <title>Humidity Switch #1</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <link rel="stylesheet" href="/style.css">
+</head>
+
+<body>
+    <h2>ESP MicroPython Web Server</h2>
+    <p>Current Temperature: <strong id="t">""",
+b"""</strong></p>
+    <p>Current Humity: <strong id="h">""",
+b"""</strong></p>
+    <p>Desired Humity: <strong id="d">""",
+b"""</strong></p>
+    <p>Mode: <span id="m">""",
+b"""</span></p>
+    <p>GPIO state: <strong id="r">""",
+b"""</strong></p>
+    <p><strong id="msg">""",
+b"""</strong></p>
+    <svg id="chart" width="300" height="100" viewBox="0 0 300 100"><polyline id="line" fill="none" stroke="#ce1b0e" points=""/></svg>
+    <p><strong><a href=".">refresh</a></strong></p>
+    <p>
+        <a href="?gpioSwitch=on"><button class="button">GPIO ON</button></a>
+    </p>
+    <p>
+        <a href="?gpioSwitch=off"><button class="button button1">GPIO OFF</button></a>
+    </p>
+    <form action="/" method="POST"><center>
+      <input type="text" name="set_humidity" placeholder="set_humidity"><br>
+      <left><button type="submit">Submit</button></left>
+    </center></form>
+    <script>
+        var modes = {off: "Off", on: "On", auto: "Auto"};
+        function show(s) {
+            document.getElementById("t").textContent = s.t;
+            document.getElementById("h").textContent = s.src ? s.h + " (" + s.hr + " " + s.src + ")" : s.h;
+            document.getElementById("d").textContent = s.d;
+            document.getElementById("m").textContent = modes[s.m];
+            document.getElementById("r").textContent = s.r ? "ON" : "OFF";
+            document.getElementById("msg").textContent = s.msg;
+        }
+        function chart(csv) {
+            var rows = csv.trim().split("\\n").slice(1).map(function (line) { return line.split(","); });
+            if (rows.length < 2) return;
+            var t0 = +rows[0][0], t1 = +rows[rows.length - 1][0];
+            var h = rows.map(function (r) { return +r[2]; });
+            var lo = Math.min.apply(null, h) - 1, hi = Math.max.apply(null, h) + 1;
+            document.getElementById("line").setAttribute("points", rows.map(function (r, i) {
+                return (300 * (r[0] - t0) / (t1 - t0)).toFixed(1) + "," + (100 - 100 * (h[i] - lo) / (hi - lo)).toFixed(1);
+            }).join(" "));
+        }
+        fetch("/api/history?step=300").then(function (r) { return r.text(); }).then(chart);
+        if (window.EventSource) {
+            new EventSource("/events").onmessage = function (e) { show(JSON.parse(e.data)); };
+        } else {
+            setInterval(function () { fetch("/api/state").then(function (r) { return r.json(); }).then(show); }, 60000);
+        }
+    </script>
+</body>
+
+</html>""",
+)
+PAGE_LENGTH = sum([len(chunk) for chunk in PAGE_CHUNKS])
+
+
+def send_page(conn, values):
+    '''Sends the static chunks with values (bytes, one per slot) between them straight to the socket'''
+    conn.sendall(PAGE_CHUNKS[0])
+    for i in range(len(values)):
+        conn.sendall(values[i])
+        conn.sendall(PAGE_CHUNKS[i + 1])
+
+# Served separately so browsers cache it instead of downloading it with every page
+STYLE_CSS = b"""html {
+    font-family: Arial;
+    display: inline-block;
+    margin: 0px auto;
+    text-align: center;
+}
+
+.button {
+    background-color: #ce1b0e;
+    border: none;
+    color: white;
+    padding: 16px 40px;
+    text-align: center;
+    text-decoration: none;
+    display: inline-block;
+    font-size: 16px;
+    margin: 4px 2px;
+    cursor: pointer;
+}
+
+.button1 {
+    background-color: #000000;
+}
+"""
+STYLE_ETAG = b'"style-1"'  # change when STYLE_CSS changes
+
+# style.css.gz (STYLE_CSS compressed by build.sh) is sent to clients that accept gzip when it was uploaded
+STYLE_GZ_FILE = 'style.css.gz'
+STYLE_GZ_ETAG = b'"style-1-gz"'
+try:
+    with open(STYLE_GZ_FILE, 'rb') as f:
+        STYLE_GZ = f.read()
+except OSError:
+    STYLE_GZ = None
@@ -0,0 +1,168 @@
+# WiFi connection state machine, poll() doesn't wait for a connection (only for an access point scan when it has
+# none cached) so it can run next to local control
+
+import time
+import utime
+import ubinascii
+import jitter
+
+STATE_IDLE = 0
+STATE_CONNECTING = 1
+STATE_CONNECTED = 2
+STATE_BACKOFF = 3
+STATE_SUSPENDED = 4
+STATE_NAMES = ("idle", "connecting", "connected", "backoff", "suspended")
+
+CONNECT_TIMEOUT_MS = 15000
+MIN_BACKOFF_MS = 2000
+MAX_BACKOFF_MS = 300000
+MAX_OUTAGES = 10  # most recent outages kept for /api/wifi
+BACKOFF_JITTER = 0.5  # each retry waits backoff +/- 50% at random
+
+
+class WifiManager:
+    '''
+    Call poll() regularly, it starts a connection attempt when due and checks on the one in progress.
+    Failed attempts are retried with jittered exponential backoff between min_backoff_ms and max_backoff_ms,
+    the first attempt is made start_delay_ms after creation (ex. a per-device offset).
+    Outages (connection lost until connected again) are recorded with their start time and duration,
+    planned disconnects between suspend() and resume() (ex. light sleep) are not.
+    The access point (BSSID and channel) is found by a scan and reconnected to directly until an attempt fails.
+    '''
+
+    def __init__(self, wlan, ssid, password, connect_timeout_ms=CONNECT_TIMEOUT_MS,
+                 min_backoff_ms=MIN_BACKOFF_MS, max_backoff_ms=MAX_BACKOFF_MS, start_delay_ms=0):
+        self.wlan = wlan
+        self.ssid = ssid
+        self.password = password
+        self.connect_timeout_ms = connect_timeout_ms
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.state = STATE_IDLE
+        self.due_ticks = utime.ticks_add(utime.ticks_ms(), start_delay_ms)  # next attempt (backoff) or end of the current attempt (connecting)
+        self.backoff_ms = min_backoff_ms
+        self.attempts = 0
+        self.connections = 0
+        self.outage_ticks = None  # ticks_ms when the connection was lost, None while connected or before the first connection
+        self.outage_time = 0
+        self.outages = []  # (start time, duration ms)
+        self.outage_total_ms = 0
+        self.bssid = None  # cached access point, None to scan before the next attempt
+        self.channel = 0
+
+    def poll(self) -> bool:
+        '''Advances the state machine, returns True while connected'''
+        if self.state == STATE_SUSPENDED:
+            return False
+        now = utime.ticks_ms()
+        connected = self.wlan.isconnected()
+
+        if self.state == STATE_CONNECTED:
+            if connected:
+                return True
+            print('WiFi connection lost')
+            self.outage_ticks = now
+            self.outage_time = time.time()
+            self.backoff_ms = self.min_backoff_ms
+            self.state = STATE_BACKOFF
+            self.due_ticks = utime.ticks_add(now, jitter.jittered(self.min_backoff_ms, BACKOFF_JITTER))
+            return False
+
+        if connected:
+            self.connected(now)
+            return True
+
+        if self.state == STATE_CONNECTING:
+            if utime.ticks_diff(now, self.due_ticks) < 0:
+                return False
+            print('WiFi attempt %d timed out, retry in %d ms' % (self.attempts, self.backoff_ms))
+            try:
+                self.wlan.disconnect()
+            except OSError:
+                pass
+            self.bssid = None  # the access point may have moved or changed channel, scan again
+            self.state = STATE_BACKOFF
+            self.due_ticks = utime.ticks_add(now, jitter.jittered(self.backoff_ms, BACKOFF_JITTER))
+            self.backoff_ms = min(self.backoff_ms * 2, self.max_backoff_ms)
+            return False
+
+        if utime.ticks_diff(now, self.due_ticks) >= 0:
+            self.start_connect(now)
+        return False
+
+    def suspend(self):
+        '''Disconnects on purpose, poll() doesn't reconnect or count an outage until resume()'''
+        self.state = STATE_SUSPENDED
+        try:
+            self.wlan.disconnect()
+        except OSError:
+            pass
+
+    def resume(self):
+        '''Reconnects at the next poll() without a backoff'''
+        if self.state == STATE_SUSPENDED:
+            self.backoff_ms = self.min_backoff_ms
+            self.due_ticks = utime.ticks_ms()
+            self.state = STATE_BACKOFF
+
+    def start_connect(self, now):
+        self.wlan.active(True)
+        self.attempts += 1
+        if self.bssid is None:
+            # blocks for a scan (about 2 s), only before the first attempt and after a failed one
+            access_point = find_access_point(self.wlan, self.ssid)
+            if access_point:
+                self.bssid, self.channel = access_point
+        try:
+            connect(self.wlan, self.ssid, self.password, self.bssid, self.channel)
+        except OSError as e:
+            print('WiFi connect failed: %s' % e)
+            self.bssid = None
+        self.state = STATE_CONNECTING
+        self.due_ticks = utime.ticks_add(now, self.connect_timeout_ms)
+
+    def connected(self, now):
+        self.state = STATE_CONNECTED
+        self.connections += 1
+        self.backoff_ms = self.min_backoff_ms
+        if self.bssid is not None:
+            print('WiFi connected to %s on channel %d' % (ubinascii.hexlify(self.bssid, ':').decode(), self.channel))
+        if self.outage_ticks is not None:
+            duration = utime.ticks_diff(now, self.outage_ticks)
+            self.outage_total_ms += duration
+            self.outages.append((self.outage_time, duration))
+            if len(self.outages) > MAX_OUTAGES:
+                self.outages.pop(0)
+            self.outage_ticks = None
+            print('WiFi reconnected after %d ms' % duration)
+
+    def to_json(self) -> bytes:
+        outages = b','.join([b'[%d,%d]' % outage for outage in self.outages])
+        bssid = ubinascii.hexlify(self.bssid, ':').decode() if self.bssid is not None else ''
+        return b'{{"state":"{0}","attempts":{1},"connections":{2},"bssid":"{3}","channel":{4},"outage_total_ms":{5},"outages":[{6}]}}'.format(
+            STATE_NAMES[self.state], self.attempts, self.connections, bssid, self.channel, self.outage_total_ms,
+            outages.decode())
+
+
+def find_access_point(wlan, ssid):
+    '''(bssid, channel) of the strongest access point with ssid, None if none was found'''
+    best = None
+    for ap_ssid, bssid, channel, rssi, _, _ in wlan.scan():
+        if ap_ssid == ssid.encode() and (best is None or rssi > best[2]):
+            best = (bssid, channel, rssi)
+    return best and best[:2]
+
+
+def connect(wlan, ssid, password, bssid=None, channel=0):
+    '''Starts connecting, directly to bssid on channel when given (where the firmware accepts them)'''
+    if bssid is None:
+        wlan.connect(ssid, password)
+        return
+    try:
+        wlan.config(channel=channel)
+    except (OSError, ValueError):
+        pass
+    try:
+        wlan.connect(ssid, password, bssid=bssid)
+    except (OSError, TypeError):
+        wlan.connect(ssid, password)  # no bssid argument in this firmware, or it was rejected